@@ -185,11 +185,11 @@ void setup() {
   );
   gpsChar = daqService->createCharacteristic(
     GPS_UUID,
-    NIMBLE_PROPERTY::READ | NIMBLE_PROPERTY::WRITE
+    NIMBLE_PROPERTY::READ | NIMBLE_PROPERTY::WRITE | NIMBLE_PROPERTY::NOTIFY
   );
   imuChar = daqService->createCharacteristic(
     IMU_UUID,
-    NIMBLE_PROPERTY::READ | NIMBLE_PROPERTY::WRITE
+    NIMBLE_PROPERTY::READ | NIMBLE_PROPERTY::WRITE | NIMBLE_PROPERTY::NOTIFY
   );
 
   // initial GPS-fix flag = 0 and clear imu data
@@ -307,7 +307,7 @@ void writeCSV(uint32_t now_ms) {
   
   if (gpsChar) {
     gpsChar->setValue(gpsOut);
-    // Notify if you want push updates to the phone/app:
+    // push updates to subscribed clients (the GUI streams these instead of polling)
     gpsChar->notify();
   }
 
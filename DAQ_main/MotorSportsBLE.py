@@ -14,46 +14,58 @@ IMU_CHARACTERISTIC_UUID          = "d69584e5-5142-414f-a90e-07c271d18576"
 
 
 
+async def stream_device(target):
+    async with BleakClient(target) as client:
+        print(f"Connected to {target.name} ({target.address})")
+
+        # with several cars live every line says which one it came from
+        car = f"[{target.name} {target.address}]"
+
+        # the ESP32 notifies both characteristics every time it logs a row,
+        # subscribe and print them as they come instead of polling
+        def on_gps(characteristic, gps_data):
+            print(car, datetime.now().strftime("%H:%M:%S"))
+            if len(gps_data) == 8:
+                latitude, longitude = struct.unpack('<ff', gps_data)
+                print(f"{car} Latitude: {latitude}, Longitude: {longitude}")
+                #the firmware always sends 8 bytes, 0.0 / 0.0 until the GPS has a fix
+                if latitude != 0 and longitude != 0:
+                    print(f"{car} GPS has a fix")
+                else:
+                    print(f"{car} No GPS fix")
+            else:
+                print(f"{car} No GPS fix")
+
+        def on_imu(characteristic, imu_data):
+            if len(imu_data) != 48:
+                return
+            # Unpack the binary data into floats (assuming 12 floats: ex, ey, ez, lx, ly, lz, ax_w, ay_w,  vx, vy, xPos, yPos)
+            imu_values = struct.unpack('<12f', imu_data)
+
+            print(f"{car} IMU Data - ex: {imu_values[0]}, ey: {imu_values[1]}, ez: {imu_values[2]}, lx: {imu_values[3]}, ly: {imu_values[4]}, lz: {imu_values[5]}, ax_w: {imu_values[6]}, ay_w: {imu_values[7]}, vx: {imu_values[8]}, vy: {imu_values[9]}, xPos: {imu_values[10]}, yPos: {imu_values[11]}")
+
+        await client.start_notify(GPS_STATUS_CHARACTERISTIC_UUID, on_gps)
+        await client.start_notify(IMU_CHARACTERISTIC_UUID, on_imu)
+        while client.is_connected:
+            await asyncio.sleep(1)
+
 async def main():
     print("Scanning for ESP32 BLE device...")
     devices = await BleakScanner.discover()
 
-    target = None
+    # every logger in range, not just the first, so several cars can be followed at once
+    targets = []
     for d in devices:
         print(f"Found: {d.name}, {d.address}")
-        # Check if the device name contains "washr" (case-insensitive)
         if d.name and "car_go_vroom" in d.name.lower():
-            target = d
+            targets.append(d)
             print(f"Target device found: {d.name}, {d.address}")
-            break
 
-    if not target:
+    if not targets:
         print("Could not find ESP32 with name 'CAR_GO_VROOM'")
         return
 
-    async with BleakClient(target) as client:
-        print(f"Connected to {target.name} ({target.address})")
-
-        print(f"Connected to {target.name}")
+    await asyncio.gather(*(stream_device(target) for target in targets))
 
-        while True:
-            # read the GPS status characteristic
-            gps_data = await client.read_gatt_char(GPS_STATUS_CHARACTERISTIC_UUID)
-            print(datetime.now().strftime("%H:%M:%S"))
-            print(f"Latitude: {gps_data[0]}, Longitude: {gps_data[1]}")
-            if(gps_data != int(0)):
-                print("GPS has a fix")
-            else:
-                print("No GPS fix")
-
-            # read the IMU characteristic
-            imu_data = await client.read_gatt_char(IMU_CHARACTERISTIC_UUID)
-
-            # Unpack the binary data into floats (assuming 12 floats: ex, ey, ez, lx, ly, lz, ax_w, ay_w,  vx, vy, xPos, yPos)
-            imu_values = struct.unpack('ffffffffffff', imu_data)
-            
-            print(f"IMU Data - ex: {imu_values[0]}, ey: {imu_values[1]}, ez: {imu_values[2]}, lx: {imu_values[3]}, ly: {imu_values[4]}, lz: {imu_values[5]}, ax_w: {imu_values[6]}, ay_w: {imu_values[7]}, vx: {imu_values[8]}, vy: {imu_values[9]}, xPos: {imu_values[10]}, yPos: {imu_values[11]}")
-            
-            await asyncio.sleep(0.5)  # poll every 0.5 seconds
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
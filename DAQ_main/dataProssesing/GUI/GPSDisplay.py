@@ -1,32 +1,46 @@
 from PySide6.QtWidgets import QWidget
-from PySide6.QtGui import QPainter, QPen, QColor, QPixmap, QPainterPath
-from PySide6.QtCore import Qt, QPointF, QTimer, Signal
-import csv
+from PySide6.QtGui import QPainter, QPen, QColor
+from PySide6.QtCore import Qt, QLineF, QPointF, Signal
 import math
-
-class DataPoint():
-    latitude = 0
-    longitude = 0
-    acceleration = 0
-    speed = 0
-    time = 0
-
-    def __init__(self, x, y, s, a, t):
-        self.latitude = x
-        self.longitude = y
-        self.speed = s
-        self.acceleration = a
-        self.time = t
+import os
+import numpy as np
+from telemetry import TelemetryStore
+from projection import LocalProjection
+from track_lod import TrackLOD
+from tile_cache import TileCache
+from playback_clock import PlaybackClock
+from console import DEBUG, WARNING, ERROR
+
+#track color from slowest to fastest, as (position 0-1, color) stops
+SPEED_COLORS = [
+    (0.0, QColor(255, 0, 0)),
+    (1.0, QColor(0, 0, 0)),
+]
+#how many steps the colormap is split into, enough that the steps do not show
+COLOR_STEPS = 128
+#a live fix only adds a segment once it is this far (m) from the last one, so a parked car adds nothing
+LIVE_MIN_STEP_M = 0.5
+
+def colormap(stops, steps):
+    # steps colors evenly spaced along the stops, linearly blended between them
+    positions = [pos for pos, _ in stops]
+    channels = [np.interp(np.linspace(0, 1, steps), positions, [getattr(color, name)() for _, color in stops])
+                for name in ("red", "green", "blue")]
+    return [QColor(int(r), int(g), int(b)) for r, g, b in zip(*channels)]
 
 class GPSWidget(QWidget):
     rows_skiped = 0
     playback = False
     output_speed = Signal(float)
     output_acceleration = Signal(float) #tuple of (ax, ay, az) in m/s^2
+    time_range_changed = Signal(int, int) #first and last time (ms) of the loaded points
+    time_changed = Signal(int) #time (ms) of the point playback is at
 
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
+        #repaints go through the window's frame clock, at most once per frame
+        self.frame_clock = main_window.frame_clock
 
         #listens to main window for updates
         main_window.gps_updated.connect(self.load_from_file)
@@ -37,20 +51,11 @@ class GPSWidget(QWidget):
         self.offset_y = self.height()/2
         self.last_mouse_pos = None
 
-        #caching the path to make faster
-        self.num_buckets = 10
+        #track coloring, speeds between min and max map onto a smooth colormap
         self.min_speed = 0
         self.max_speed = 30
-
-        self.paths = [QPainterPath() for _ in range(self.num_buckets)]
-        self.bucket_colors = [
-            QColor(
-                int(255 * (1 - i / (self.num_buckets - 1))),       # R
-                0,                                                 # G
-                0                                                  # B
-            )
-            for i in range(self.num_buckets)
-        ]
+        #flat caps, the segments meet end to end anyway and square caps cost more to fill
+        self.speed_pens = [QPen(color, 3, Qt.SolidLine, Qt.FlatCap) for color in colormap(SPEED_COLORS, COLOR_STEPS)]
 
         #zoom settings
         self.zoom = 1.0
@@ -60,47 +65,54 @@ class GPSWidget(QWidget):
         #display setting
         self.scale = 10  # pixels per meter
 
-        self.data: list[DataPoint] = list()
-        self.lat_offset = 0
-        self.lon_offset = 0
+        self.data = TelemetryStore.empty()
+        #set while the window's file source is still sending chunks of the run
+        self.loading = False
 
         #coloring the line
         self.speeds = []
         self.colors = []
 
-        #grid state
-        self.grid_cache = None
+        #grid state, rendered in tiles that panning only moves around
+        self.grid_tiles = TileCache(self.draw_grid_tile)
+
+        #whole track at several resolutions, built once per load
+        self.track = None
+
+        #live track of the car picked in the window, fixes projected about its first one
+        #and drawn as they come in, segments grouped by speed color
+        self.live_projection = None
+        self.live_lines = {}
+        self.live_point = None
 
         #settings for playback
-        self.points = []
+        #index of the last point played, the track is drawn up to here
+        self.drawn_index = -1
         self.playback_index = 0
-        self.ms_per_point = 100
-        #only show one update in 50 becuase the GPS updates slower than the adafruit polls
-        #this should not lose any data and be much easier to work with
-        self.playback_step_size = 50
-
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.playback_step)
-        self.update_grid_cache()
-        self.update()
+        #playback follows the millis column, the clock says which log time should be on screen
+        #and each frame jumps straight to the sample for it, so the rate does not depend on the sample rate
+        self.playback_clock = PlaybackClock()
+        #current position dot, between samples when playing slowly
+        self.dot = None
+        self.frame_clock.tick.connect(self.playback_frame)
+        self.frame_clock.mark_dirty(self)
 
     def paintEvent(self, event):
         p = QPainter(self)
         p.setRenderHint(QPainter.Antialiasing)
 
         # Draw background
-        if self.grid_cache:
-            p.drawPixmap(0, 0, self.grid_cache)
+        self.grid_tiles.draw(p, self.zoom, self.offset_x, self.offset_y, self.width(), self.height(), self.devicePixelRatioF())
 
         #draw text in the top left corner
         p.setPen(QColor(255, 255, 255))
         p.setFont(p.font())
 
         if self.playback_index < len(self.data):
-            t = self.data[self.playback_index].time/1000
+            t = self.data.time[self.playback_index]/1000
             p.drawText(10, 20, f"Time: {t:.2f}s")
         elif(self.playback_index != 0):
-            t = self.data[-1].time/1000
+            t = self.data.time[-1]/1000
             p.drawText(10, 20, f"Time: {t:.2f}s")
 
         # Apply zoom around center
@@ -108,31 +120,46 @@ class GPSWidget(QWidget):
         p.scale(self.zoom, self.zoom)
         p.translate(-self.width() / 2, -self.height() / 2)
 
-        offset = QPointF(self.offset_x, self.offset_y)
+        #pan by moving the painter rather than copying the paths
+        p.translate(self.offset_x, self.offset_y)
+
+        if self.live_point is not None:
+            for color, lines in self.live_lines.items():
+                p.setPen(self.speed_pens[color])
+                p.drawLines(lines)
+            p.setPen(QPen(Qt.red, 6))
+            p.drawPoint(self.live_point)
+            return
+
+        if self.track is None or self.drawn_index < 0:
+            return
+        index = min(self.drawn_index, len(self.track) - 1)
 
-        # Draw path with speed-based color
-        if len(self.points) > 1:
-            # Draw cached paths by bucket
-            for i, path in enumerate(self.paths):
-                if not path.isEmpty():
-                    p.setPen(QPen(self.bucket_colors[i], 3))
-                    p.drawPath(path.translated(offset))
+        # Draw path with speed-based color, only the resolution for this zoom
+        # and only the blocks of it that are on screen, one call per color
+        for color, lines in self.track.draw_list(self.zoom, self.view_rect(), index):
+            p.setPen(self.speed_pens[color])
+            p.drawLines(lines)
 
         # Draw current position dot
-        if self.points:
-            p.setPen(QPen(Qt.red, 6))
-            p.drawPoint(self.points[-1] + offset)
+        p.setPen(QPen(Qt.red, 6))
+        p.drawPoint(self.dot if self.dot is not None else QPointF(self.track.x[index], self.track.y[index]))
+
+    def view_rect(self):
+        # the part of the track (in track coordinates) that is on screen, inverse of the paint transform
+        cx = self.width() / 2
+        cy = self.height() / 2
+        left = -cx / self.zoom + cx - self.offset_x
+        top = -cy / self.zoom + cy - self.offset_y
+        right = cx / self.zoom + cx - self.offset_x
+        bottom = cy / self.zoom + cy - self.offset_y
+        return left, top, right, bottom
 
     #for dragging veiw around with the mouse
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
             self.last_mouse_pos = event.pos()
 
-    #update trigger to recach grid when display is resized
-    def resizeEvent(self, event):
-        self.update_grid_cache()
-        super().resizeEvent(event)
-
     #zoom control
     def wheelEvent(self, event):
         zoom_factor = 1.15
@@ -158,29 +185,24 @@ class GPSWidget(QWidget):
 
         #save zoom and update
         self.zoom = new_zoom
-        self.update_grid_cache()
-        self.update()
+        self.frame_clock.mark_dirty(self)
 
-    def draw_grid(self, p):
+    def draw_grid_tile(self, p, x, y, size, zoom):
+        # one tile of the grid, (x, y) is the tile's corner in canvas coordinates (screen minus pan offset)
         grid_spacing = 50  # pixels at zoom=1
-        scaled_spacing = grid_spacing * self.zoom
-
-        left = int((-self.offset_x) // scaled_spacing) - 1
-        right = int((self.width() - self.offset_x) // scaled_spacing) + 1
-        top = int((-self.offset_y) // scaled_spacing) - 1
-        bottom = int((self.height() - self.offset_y) // scaled_spacing) + 1
+        scaled_spacing = grid_spacing * zoom
 
+        p.fillRect(0, 0, size, size, QColor("#350E0E"))
         p.setPen(QPen(QColor(255, 255, 255, 30), 1))
 
+        # one line either side of the tile too so lines on a tile edge are not lost to rounding
+        for k in range(math.floor(x / scaled_spacing) - 1, math.ceil((x + size) / scaled_spacing) + 1):
+            px = k * scaled_spacing - x
+            p.drawLine(QPointF(px, 0), QPointF(px, size))
 
-        for x in range(left, right):
-            px = x * scaled_spacing + self.offset_x
-            p.drawLine(px, 0, px, self.height())
-
-        for y in range(top, bottom):
-            py = y * scaled_spacing + self.offset_y
-            p.drawLine(0, py, self.width(), py)
-
+        for k in range(math.floor(y / scaled_spacing) - 1, math.ceil((y + size) / scaled_spacing) + 1):
+            py = k * scaled_spacing - y
+            p.drawLine(QPointF(0, py), QPointF(size, py))
 
     def mouseMoveEvent(self, event):
         if self.last_mouse_pos:
@@ -191,72 +213,106 @@ class GPSWidget(QWidget):
             self.offset_y += dy
 
             self.last_mouse_pos = event.pos()
-            self.update_grid_cache()
-            self.update()
+            self.frame_clock.mark_dirty(self)
 
     def mouseReleaseEvent(self, event):
         self.last_mouse_pos = None
 
-    def update_grid_cache(self):
-        if self.width() <= 0 or self.height() <= 0:
-            return
-        self.grid_cache = QPixmap(self.size())
-        self.grid_cache.fill(QColor("#350E0E"))
-        p = QPainter(self.grid_cache)
-        self.draw_grid(p)
-        p.end()
-
-    def speed_to_bucket(self, speed):
-        speed = max(self.min_speed, min(self.max_speed, speed))
-        t = (speed - self.min_speed) / (self.max_speed - self.min_speed)
-        return int(t * (self.num_buckets - 1))
+    def speeds_to_colors(self, speeds):
+        # index into speed_pens for each speed
+        t = (np.clip(speeds, self.min_speed, self.max_speed) - self.min_speed) / (self.max_speed - self.min_speed)
+        return np.rint(t * (len(self.speed_pens) - 1)).astype(int)
 
     def get_time(self):
         if self.playback_index < len(self.data):
-            return self.data[self.playback_index].time
+            return self.data.time[self.playback_index]
         else:
             return 0
 
-    def latlon_to_point(self, lat, lon):
-        # Earth radius approximation
-        meters_per_deg_lat = 111_320
-        meters_per_deg_lon = 111_320 * math.cos(math.radians(self.lat_offset))
-
-        x = (lon - self.lon_offset) * meters_per_deg_lon
-        y = -(lat - self.lat_offset) * meters_per_deg_lat
-        return QPointF(x * self.scale, y * self.scale)
-
-    def playback_step(self):
-        if self.playback_index >= len(self.data):
-            self.timer.stop()
+    def make_track(self, data):
+        # called on the file source's worker thread, so it only reads settings and builds the TrackLOD
+        if len(data) == 0:
+            return None
+        # the store already has the fixes in meters east / north of the first one, screen y points down
+        x = data.x * self.scale
+        y = -data.y * self.scale
+        return TrackLOD(x, y, self.speeds_to_colors(data.speed), self.zoom_min, self.zoom_max)
+
+    def playback_frame(self):
+        # once per frame, samples between the last frame and this one are skipped
+        if not self.playback or len(self.data) == 0:
             return
 
-        latitude = self.data[self.playback_index].latitude
-        longitude = self.data[self.playback_index].longitude
-        acceleration = self.data[self.playback_index].acceleration
-        speed = self.data[self.playback_index].speed
-
-        point = self.latlon_to_point(latitude, longitude)
-
-        self.main_window.text_console.log_message(
-            f"point LAT:{latitude} LON:{longitude}"
-        )
+        t = self.playback_clock.log_time()
+        end = self.data.time[-1]
+        if t >= end:
+            t = end
+            #hold at the last point if the file is still loading, otherwise playback is done
+            self.playback_clock.seek(end)
+            if not self.is_loading():
+                self.set_playback_status(False)
+
+        index = self.index_at_time(t)
+        if index != self.playback_index or self.drawn_index < 0:
+            self.show_point(index)
+        self.dot = self.position_at_time(t, index)
+        self.frame_clock.mark_dirty(self)
+
+    def show_point(self, index):
+        latitude = self.data.lat[index]
+        longitude = self.data.lon[index]
+        acceleration = float(self.data.accel[index])
+        speed = float(self.data.speed[index])
+
+        #per point trace, off unless the console is set to debug
+        if self.main_window.text_console.enabled(DEBUG):
+            self.main_window.text_console.log_message(
+                f"point LAT:{latitude} LON:{longitude}", DEBUG
+            )
 
         if(speed > 0):
             self.output_speed.emit(speed)
             self.output_acceleration.emit(acceleration)
-        bucket = self.speed_to_bucket(speed)
-
-        # add segment to correct bucket path
-        if self.points:
-            self.paths[bucket].moveTo(self.points[-1])
-            self.paths[bucket].lineTo(point)
-        else:
-            self.paths[bucket].moveTo(point)
 
-        self.points.append(point)
-        self.playback_index += self.playback_step_size
-        self.update()
+        # the track gets drawn up to this point
+        self.playback_index = index
+        self.drawn_index = index
+        self.time_changed.emit(int(self.data.time[index]))
+
+    def position_at_time(self, t, index):
+        # where the dot goes at log time t, part way from point index to the next one
+        if self.track is None or index + 1 >= len(self.track):
+            return None
+        t0 = self.data.time[index]
+        t1 = self.data.time[index + 1]
+        f = min(max((t - t0) / (t1 - t0), 0.0), 1.0) if t1 > t0 else 0.0
+        x = self.track.x[index] + f * (self.track.x[index + 1] - self.track.x[index])
+        y = self.track.y[index] + f * (self.track.y[index + 1] - self.track.y[index])
+        return QPointF(x, y)
+
+    def index_at_time(self, t):
+        # last point at or before time t (ms), binary search of the time column
+        i = int(np.searchsorted(self.data.time, t, side="right")) - 1
+        return max(0, min(i, len(self.data) - 1))
+
+    def seek_time(self, t):
+        self.seek(self.index_at_time(t))
+
+    def seek(self, index):
+        """
+        Jumps playback to point index, forwards or back. The track up to there
+        comes from the prebuilt track levels so nothing gets replayed.
+        """
+        if len(self.data) == 0:
+            return
+        index = max(0, min(index, len(self.data) - 1))
+        self.playback_index = index
+        self.drawn_index = index
+        self.dot = None
+        self.playback_clock.seek(self.data.time[index])
+        self.output_speed.emit(float(self.data.speed[index]))
+        self.time_changed.emit(int(self.data.time[index]))
+        self.frame_clock.mark_dirty(self)
 
     def set_playback_status(self, status):
         self.main_window.text_console.log_message(
@@ -267,87 +323,141 @@ class GPSWidget(QWidget):
         if status:
             #add this code back to change is so prev loaded points are cleard when pause it pressed
             #self.playback_index = 0
-            #self.points.clear()
-            self.timer.start(self.ms_per_point)  # ms per point
+            #self.drawn_index = -1
+            if len(self.data) > 0 and self.playback_index >= len(self.data) - 1:
+                # played to the end, start over
+                self.seek(0)
+            self.playback_clock.play()
         else:
-            self.timer.stop()
+            self.playback_clock.pause()
+
+    def set_playback_rate(self, rate):
+        # log seconds per real second
+        self.playback_clock.set_rate(rate)
 
     def load_from_file(self, path):
+        # the window's FileSource reads the run, this only clears the old one out of the way
         if(path == None):
             self.main_window.text_console.log_message(
-            f"failed to load any points please provide a valid path"
+            f"failed to load any points please provide a valid path", ERROR
             )
             return
 
         #clear any prev loaded points
         self.playback_index = 0
-        self.points.clear()
-
-        self.data.clear()
-
-        with open(path, "r", newline="") as csvfile:
-            reader = csv.reader(csvfile)
-            headers = next(reader)
-
-            # normalize header names
-            header_map = {h.strip().lower(): i for i, h in enumerate(headers)}
-
-            # possible column names
-            try:
-                lat_key = next(k for k in header_map if "lat" in k)
-                lon_key = next(k for k in header_map if "lon" in k)
-                time_key = next(k for k in header_map if "millis" in k)
-                vx_imu_key = next(k for k in header_map if "vx_imu" in k)
-                vy_imu_key = next(k for k in header_map if "vy_imu" in k)
-                ax_w_key = next(k for k in header_map if "ax_w" in k)
-                ay_w_key = next(k for k in header_map if "ay_w" in k)
-            except StopIteration:
-                self.main_window.text_console.log_message(
-                    f"Loaded File does not have propper data labeling \n unable to load lon/lat data cols"
-                )
-                return
-
-            lat_idx = header_map[lat_key]
-            lon_idx = header_map[lon_key]
-            time_idx = header_map[time_key]
-            vx_imu_idx = header_map[vx_imu_key]
-            vy_imu_idx = header_map[vy_imu_key]
-            ax_w_idx = header_map[ax_w_key]
-            ay_w_idx = header_map[ay_w_key]
-            
-            data_import_list: list[DataPoint] = list()
-
-            for row in reader:
-                try:
-                    data_import_list.append(DataPoint(
-                        x = float(row[lat_idx]),
-                        y = float(row[lon_idx]),
-                        s = math.sqrt(float(row[vx_imu_idx])*float(row[vx_imu_idx])+float(row[vy_imu_idx])*float(row[vy_imu_idx])),
-                        a = math.sqrt(float(row[ax_w_idx])*float(row[ax_w_idx])+float(row[ay_w_idx])*float(row[ay_w_idx])),
-                        t = int(row[time_idx])
-                        ))
-                except (ValueError, IndexError):
-                    continue  # skip bad rows
-
-            #remove values from before the GPS inits
-            self.rows_skiped = 0
-
-            for d in data_import_list:
-                if d.latitude != 0 and d.longitude != 0:
-                    self.data.append(d)
-                else: self.rows_skiped += 1
-                
-            self.lat_offset = self.data[0].latitude
-            self.lon_offset = self.data[0].longitude
-
+        self.drawn_index = -1
+        self.dot = None
+        self.track = None
+        self.loading = True
+        self.clear_live()
+
+        self.data = TelemetryStore.empty()
+        self.frame_clock.mark_dirty(self)
+
+    def start_live(self):
+        # a live source (or another car) takes over the map, the loaded run is dropped
+        self.set_playback_status(False)
+        self.playback_index = 0
+        self.drawn_index = -1
+        self.dot = None
+        self.track = None
+        self.loading = False
+        self.data = TelemetryStore.empty()
+        self.clear_live()
+        self.frame_clock.mark_dirty(self)
+
+    def clear_live(self):
+        self.live_projection = None
+        self.live_lines = {}
+        self.live_point = None
+
+    def on_live_fixes(self, lat, lon, speed):
+        """
+        GPS fixes from the window's live source, appended to the live track in
+        the color of speed (the car's latest speed, fixes do not carry one).
+        """
+        fix = np.isfinite(lat) & np.isfinite(lon) & (lat != 0) & (lon != 0)
+        if not fix.any():
+            return
+        lat = lat[fix]
+        lon = lon[fix]
+        if self.live_projection is None:
+            self.live_projection = LocalProjection.from_fixes(lat, lon)
+        x, y = self.live_projection.to_xy(lat, lon)
+        color = int(self.speeds_to_colors(np.array([speed]))[0])
+        lines = self.live_lines.setdefault(color, [])
+        step = LIVE_MIN_STEP_M * self.scale
+        for px, py in zip((x * self.scale).tolist(), (-y * self.scale).tolist()):
+            point = QPointF(px, py)
+            if self.live_point is None:
+                self.live_point = point
+            elif math.hypot(px - self.live_point.x(), py - self.live_point.y()) >= step:
+                lines.append(QLineF(self.live_point, point))
+                self.live_point = point
+        self.frame_clock.mark_dirty(self)
+
+    def is_loading(self):
+        return self.loading
+
+    def on_track_batch(self, batch):
+        # a TrackBatch from the window's FileSource (see data_source.py)
+        if not self.loading:
+            return
+        if batch.final:
+            self.on_load_finished(batch.store, batch.track)
+            return
+        self.main_window.text_console.log_message(f"loading {os.path.basename(batch.path)}: {batch.progress:.0%}")
+        #the source only sends the run so far (and its track) once it has doubled since the last time
+        if batch.store is not None:
+            self.on_partial_load(batch.store, batch.track)
+
+    def on_partial_load(self, data, track):
+        #start of the track can be shown (and played) while the rest loads
+        if len(self.data) == 0 and len(data) > 0:
+            self.playback_clock.seek(data.time[0])
+        self.data = data
+        self.track = track
+        if len(self.data) > 0:
+            self.time_range_changed.emit(int(self.data.time[0]), int(self.data.time[-1]))
+        self.frame_clock.mark_dirty(self)
+
+    def on_load_finished(self, data, track):
+        #nothing to swap in if the last partial load already had the whole run
+        if len(data) != len(self.data) or self.track is not track:
+            self.on_partial_load(data, track)
+        self.loading = False
+
+        #rows from before the GPS inits are dropped by the store
+        self.rows_skiped = self.data.rows_skipped
+
+        if len(self.data) == 0:
             self.main_window.text_console.log_message(
-                f"Loaded {len(self.data)} Data Points. Skipped {self.rows_skiped} rows."
+                f"Loaded File has no rows with a GPS fix", WARNING
             )
+            return
+
+        self.main_window.text_console.log_message(
+            f"Loaded {len(self.data)} Data Points. Skipped {self.rows_skiped} rows."
+        )
+
+    def on_load_cancelled(self):
+        # whatever was loaded stays and can be played, playback just no longer waits for the rest
+        if not self.loading:
+            return
+        self.loading = False
+        self.main_window.text_console.log_message(f"Stopped loading after {len(self.data)} Data Points.")
+
+    def on_load_failed(self, message):
+        self.loading = False
+        self.main_window.text_console.log_message(
+            f"Loaded File does not have propper data labeling \n unable to load lon/lat data cols ({message})", ERROR
+        )
+
     #used in acceleration chart to get time value for each point so it can be mapped to the x axis
     def get_time(self):
         if self.playback_index < len(self.data):
-            return self.data[self.playback_index].time
+            return self.data.time[self.playback_index]
         elif(self.playback_index != 0):
-            return self.data[-1].time
+            return self.data.time[-1]
         else:
             return 0
\ No newline at end of file
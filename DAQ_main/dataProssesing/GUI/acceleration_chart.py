@@ -1,11 +1,38 @@
 from PySide6.QtWidgets import QWidget
 from PySide6.QtGui import QPainter, QColor, QPen
+from PySide6.QtCore import QLineF
+import numpy as np
+
+#how much history the chart shows (ms of log time)
+WINDOW_MS = 120000
+#samples kept, anything older than this many samples falls off even if it is inside the window
+#(only read back when the chart is resized, painting works off the pixel column bins)
+CAPACITY = 1 << 16
+#bin id of a bin nothing has been put in
+EMPTY_BIN = np.iinfo(np.int64).min
+
 class AccelerationChart(QWidget):
-    def __init__(self, GPS):
+    def __init__(self, GPS, frame_clock, window_ms=WINDOW_MS, capacity=CAPACITY):
         #TODO setup time var in main window
         self.GPS = GPS #used to get time value
         super().__init__()
-        self.acceleration_data = []  # list of (time, acceleration) tuples]
+        self.frame_clock = frame_clock
+        #ring buffer of (time, acceleration), preallocated so a long session does not grow it
+        self.window_ms = window_ms
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros(capacity)
+        self.count = 0 #samples in the buffer
+        self.head = 0 #where the next sample goes
+        #min / max / first / last acceleration per pixel column wide slice of the window, kept up to
+        #date as samples come in so a paint only ever looks at about a width's worth of bins.
+        #bin k covers log time [k, k + 1) * bin_ms and sits in slot k % len(bin_ids)
+        self.bin_width = 0
+        self.bin_ms = 1.0
+        self.bin_ids = np.empty(0, dtype=np.int64)
+        self.bin_lows = np.empty(0)
+        self.bin_highs = np.empty(0)
+        self.bin_firsts = np.empty(0)
+        self.bin_lasts = np.empty(0)
         self.max_acceleration = 0
         self.start_time = -1
         self.end_time = 0
@@ -18,14 +45,96 @@ class AccelerationChart(QWidget):
         self.update()  # trigger initial paint
 
     def add_acceleration(self, acceleration):
+        # one sample from file playback, at the time the GPS display is at
+        self.add_samples(np.array([self.GPS.get_time()]), np.array([acceleration]))
+
+    def add_samples(self, times, accelerations):
+        # samples with their own times (ms), e.g. a batch from a live source
+        if len(times) == 0:
+            return
+        if self.count and times[0] < self.end_time:
+            # playback jumped back, what is in the buffer is from later on
+            self.clear()
         if(self.start_time == -1):
-            self.start_time = self.GPS.get_time()  # get initial time from GPS
-        time = self.GPS.get_time()  # get current time from GPS
-        self.acceleration_data.append((time, acceleration))
-        self.max_acceleration = max(self.max_acceleration, acceleration)
-        self.max_acceleration = max(self.max_acceleration, acceleration)
-        self.end_time = time
-        self.update()  # trigger repaint to show new data
+            self.start_time = times[0]
+
+        capacity = len(self.times)
+        times = times[-capacity:]
+        accelerations = accelerations[-capacity:]
+        slots = (self.head + np.arange(len(times))) % capacity
+        self.times[slots] = times
+        self.values[slots] = accelerations
+        self.head = (self.head + len(times)) % capacity
+        self.count = min(self.count + len(times), capacity)
+        self.add_to_bins(times, accelerations)
+
+        self.max_acceleration = max(self.max_acceleration, float(np.max(accelerations)))
+        self.end_time = times[-1]
+        self.frame_clock.mark_dirty(self)  # repaint with the new data next frame
+
+    def set_bin_width(self, width):
+        # a bin per pixel column, a resize sorts whatever is still in the buffer into the new bins
+        self.bin_width = width
+        self.bin_ms = self.window_ms / width
+        self.bin_ids = np.full(width + 2, EMPTY_BIN, dtype=np.int64)
+        self.bin_lows = np.zeros(width + 2)
+        self.bin_highs = np.zeros(width + 2)
+        self.bin_firsts = np.zeros(width + 2)
+        self.bin_lasts = np.zeros(width + 2)
+        if self.count:
+            self.add_to_bins(*self.samples())
+
+    def add_to_bins(self, times, values):
+        if self.bin_width == 0:
+            self.set_bin_width(max(int(self.element_width), 2))
+            return
+        ids = np.floor(np.asarray(times) / self.bin_ms).astype(np.int64)
+        # times only go forward so each bin is one run of samples, only the newest bins fit in the ring
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))[-len(self.bin_ids):]
+        ends = np.concatenate((starts[1:], [len(ids)]))
+        ids = ids[starts]
+        lows = np.minimum.reduceat(values, starts)
+        highs = np.maximum.reduceat(values, starts)
+        slots = ids % len(self.bin_ids)
+        #the first of these bins may already hold samples from the previous call
+        seen = self.bin_ids[slots] == ids
+        self.bin_lows[slots] = np.where(seen, np.minimum(self.bin_lows[slots], lows), lows)
+        self.bin_highs[slots] = np.where(seen, np.maximum(self.bin_highs[slots], highs), highs)
+        self.bin_firsts[slots] = np.where(seen, self.bin_firsts[slots], values[starts])
+        self.bin_lasts[slots] = values[ends - 1]
+        self.bin_ids[slots] = ids
+
+    def clear(self):
+        self.count = 0
+        self.head = 0
+        self.bin_ids[:] = EMPTY_BIN
+        self.max_acceleration = 0
+        self.start_time = -1
+        self.end_time = 0
+
+    def samples(self):
+        # buffer contents oldest first, as views where possible
+        if self.count < len(self.times):
+            return self.times[:self.count], self.values[:self.count]
+        return np.roll(self.times, -self.head), np.roll(self.values, -self.head)
+
+    def decimate(self, width):
+        """
+        Acceleration per pixel column over the last window_ms, as arrays of
+        column x, min, max, first and last value in the column. Read straight
+        from the bins, so it costs the same however many samples are in the window.
+        """
+        if width != self.bin_width:
+            self.set_bin_width(width)
+        last = int(np.floor(self.end_time / self.bin_ms))
+        ids = np.arange(last - width + 1, last + 1)
+        slots = ids % len(self.bin_ids)
+        filled = self.bin_ids[slots] == ids
+        if np.count_nonzero(filled) < 2:
+            return None
+        slots = slots[filled]
+        return (np.flatnonzero(filled), self.bin_lows[slots], self.bin_highs[slots],
+                self.bin_firsts[slots], self.bin_lasts[slots])
 
     # Utility function to map a value from one range to another
     def map(self, value, in_min, in_max, out_min, out_max):
@@ -36,12 +145,17 @@ class AccelerationChart(QWidget):
         return (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
     def paintEvent(self, event):
-        if len(self.acceleration_data) < 2:
+        if self.count < 2:
             return
 
         if self.end_time <= self.start_time or self.max_acceleration == 0:
             return
 
+        decimated = self.decimate(max(int(self.element_width), 2))
+        if decimated is None:
+            return
+        columns, lows, highs, firsts, lasts = decimated
+
         p = QPainter(self)
         try:
             p.setRenderHint(QPainter.Antialiasing)
@@ -51,21 +165,26 @@ class AccelerationChart(QWidget):
             pen.setWidth(3)
             p.setPen(pen)
 
-            #draw out all points in acceleration data
-            last_point = (0, self.height + self.vert_boarder)  # start at bottom left
-            for time, acceleration in self.acceleration_data[-30:]:
-                x = self.map(time, self.acceleration_data[-30][0], self.end_time, 0, self.width)
-                y = self.map(acceleration, 0, self.max_acceleration, self.height + self.vert_boarder, self.vert_boarder)
-
-                p.drawLine(int(last_point[0]), int(last_point[1]), int(x), int(y))
-                last_point = (x, y)
+            #a line from the min to the max of every pixel column so spikes between pixels still show,
+            #and one joining each column's last sample to the next column's first
+            #(separate lines, a polyline this jagged is much slower for Qt to stroke)
+            bottom = self.element_height + self.vert_boarder
+            scale = self.element_height / self.max_acceleration
+            xs = (columns + self.horizontal_boarder).tolist()
+            lows = (bottom - lows * scale).tolist()
+            highs = (bottom - highs * scale).tolist()
+            firsts = (bottom - firsts * scale).tolist()
+            lasts = (bottom - lasts * scale).tolist()
+            lines = [QLineF(x, low, x, high) for x, low, high in zip(xs, lows, highs)]
+            lines += [QLineF(xs[i], lasts[i], xs[i + 1], firsts[i + 1]) for i in range(len(xs) - 1)]
+            p.drawLines(lines)
             self.draw_axis(p)
         finally:
             p.end()
 
     def resizeEvent(self, event):
-        self.width = event.size().width()
-        self.height = event.size().height()*self.max_height/100 - 2 * self.vert_boarder
+        self.element_width = event.size().width() - 2 * self.horizontal_boarder
+        self.element_height = event.size().height()*self.max_height/100 - 2 * self.vert_boarder
         self.update()  # trigger repaint on resize
 
     def draw_axis(self, p):
@@ -1,8 +1,9 @@
 import asyncio
-import struct
+import time
 from datetime import datetime
 from bleak import BleakScanner, BleakClient
 import sys
+from frame_decoder import GPS_FIELDS, IMU_FIELDS, KIND_GPS, KIND_IMU, FrameDecoder, decode_gps, decode_imu
 
 class DataGetter:
     DEVICE_ADDRESS = "CAR_GO_VROOM"
@@ -11,29 +12,67 @@ class DataGetter:
     GPS_STATUS_CHARACTERISTIC_UUID   = "d69584e5-5142-414f-a90e-07c271d18575"
     IMU_CHARACTERISTIC_UUID          = "d69584e5-5142-414f-a90e-07c271d18576"
 
-    def __init__(self):
-        self.client = None
+    def __init__(self, client=None, name=DEVICE_ADDRESS, device=None, label=None):
+        """
+        client can be anything with BleakClient's connect / disconnect /
+        read_gatt_char / start_notify / stop_notify, e.g. a fake one in a test.
+        If it is given there is no scan, connect() just connects it.
+        device is a BLEDevice found by find_devices() to connect to without
+        scanning again, otherwise connect() scans for the first device whose
+        name contains name. label tags every batch this getter streams, so
+        batches from several loggers can be told apart.
+        """
+        self.client = client
+        self.name = name
+        self.device = device
+        if label is None and device is not None:
+            label = f"{device.name} ({device.address})"
+        self.label = label
+        #payloads are decoded into column buffers as they arrive, stream() hands them out in batches
+        self.decoders = {
+            "gps": FrameDecoder("gps", KIND_GPS, GPS_FIELDS, label),
+            "imu": FrameDecoder("imu", KIND_IMU, IMU_FIELDS, label),
+        }
+        self.data_ready = asyncio.Event()
+        self.streaming = False
+        self.logger = None
 
-    async def connect(self, logger=None):
+    @classmethod
+    async def find_devices(cls, name=DEVICE_ADDRESS, logger=None):
+        """
+        Scans once and returns every device whose name contains name, so
+        several loggers can be connected to at the same time.
+        """
         if logger:
             logger.log_message("Scanning for ESP32 BLE device...")
         else:
             print("Scanning for ESP32 BLE device...")
         devices = await BleakScanner.discover()
 
-        target = None
+        targets = []
         for d in devices:
             if logger:
                 logger.log_message(f"Found device: {d.name} ({d.address})")
             else:
                 print(f"Found device: {d.name} ({d.address})")
-            if d.name and "car_go_vroom" in d.name.lower():
-                target = d
+            if d.name and name.lower() in d.name.lower():
+                targets.append(d)
                 if logger:
                     logger.log_message(f"Found target device: {d.name} ({d.address})")
                 else:
                     print(f"Found target device: {d.name} ({d.address})")
-                break
+        return targets
+
+    async def connect(self, logger=None):
+        self.logger = logger
+        if self.client is not None:
+            await self.client.connect()
+            return True
+
+        target = self.device
+        if target is None:
+            targets = await self.find_devices(self.name, logger)
+            target = targets[0] if targets else None
 
         if not target:
             if logger:
@@ -42,31 +81,96 @@ class DataGetter:
                 print("Target device not found.")
             return False
 
-        self.client = BleakClient(target)
+        #a car out of range would otherwise leave stream() waiting for notifications forever
+        self.client = BleakClient(target, disconnected_callback=self.on_disconnected)
         await self.client.connect()
         if logger:
             logger.log_message(f"Connected to {target.name} ({target.address})")
         else:
             print(f"Connected to {target.name} ({target.address})")
         return True
-    
+
+    def stats(self):
+        # per characteristic sample counts, rate, longest gap between notifications, delay and losses
+        return {name: decoder.stats() for name, decoder in self.decoders.items()}
+
     async def disconnect(self, logger=None):
         if self.client:
+            await self.stop_stream()
             await self.client.disconnect()
             if logger:
-                logger.log_message("Disconnected from device.")
+                logger.log_message(f"Disconnected from {self.label or 'device'}.")
             else:
-                print("Disconnected from device.")
+                print(f"Disconnected from {self.label or 'device'}.")
 
     async def read_gps_status(self):
         if self.client:
             gps_data = await self.client.read_gatt_char(self.GPS_STATUS_CHARACTERISTIC_UUID)
-            return gps_data
+            return decode_gps(gps_data)
         return None
 
     async def read_imu_data(self):
         if self.client:
             imu_data = await self.client.read_gatt_char(self.IMU_CHARACTERISTIC_UUID)
-            imu_values = struct.unpack('ffffffffffff', imu_data)
-            return imu_values
-        return None
\ No newline at end of file
+            return decode_imu(imu_data)
+        return None
+
+    async def start_stream(self):
+        """
+        Subscribes to GPS and IMU notifications, samples come in at whatever rate
+        the device sends them instead of being polled.
+        """
+        if self.streaming:
+            return
+        await self.client.start_notify(self.GPS_STATUS_CHARACTERISTIC_UUID, self.on_gps)
+        await self.client.start_notify(self.IMU_CHARACTERISTIC_UUID, self.on_imu)
+        self.streaming = True
+
+    async def stop_stream(self):
+        if not self.streaming:
+            return
+        self.streaming = False
+        await self.client.stop_notify(self.GPS_STATUS_CHARACTERISTIC_UUID)
+        await self.client.stop_notify(self.IMU_CHARACTERISTIC_UUID)
+        # wakes up stream() so it can finish
+        self.data_ready.set()
+
+    async def stream(self):
+        """
+        Async iterator over SampleBatches (see frame_decoder.py), starting the
+        notifications if needed. Each batch holds everything of one kind that
+        arrived since the consumer last asked, so a slow consumer gets bigger
+        batches rather than falling behind one sample at a time:
+            async for batch in data_getter.stream(): ...
+        """
+        await self.start_stream()
+        while True:
+            await self.data_ready.wait()
+            self.data_ready.clear()
+            for decoder in self.decoders.values():
+                batch = decoder.drain()
+                if batch is not None:
+                    yield batch
+            if not self.streaming:
+                return
+
+    def on_disconnected(self, client):
+        # bleak calls this for every disconnect, only one while streaming was not asked for
+        if not self.streaming:
+            return
+        self.streaming = False
+        # wakes up stream() so it hands out what is left and finishes
+        self.data_ready.set()
+        if self.logger:
+            self.logger.log_message(f"Lost connection to {self.label or 'device'}.")
+        else:
+            print(f"Lost connection to {self.label or 'device'}.")
+
+    #bleak calls these on the event loop with (characteristic, bytearray)
+    def on_gps(self, characteristic, data):
+        if self.decoders["gps"].feed(data, time.monotonic() * 1000):
+            self.data_ready.set()
+
+    def on_imu(self, characteristic, data):
+        if self.decoders["imu"].feed(data, time.monotonic() * 1000):
+            self.data_ready.set()
@@ -1,18 +1,74 @@
-from PySide6.QtWidgets import QApplication, QMainWindow, QTextEdit, QVBoxLayout, QWidget
+from PySide6.QtWidgets import QApplication, QMainWindow, QPlainTextEdit, QVBoxLayout, QWidget, QComboBox
+from PySide6.QtCore import QTimer
+from collections import deque
 import sys
 
+#log levels, messages under the console's level are dropped before they are even queued
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "Debug", INFO: "Info", WARNING: "Warning", ERROR: "Error"}
+
+#lines the console keeps, older ones are removed as new ones come in
+MAX_LINES = 2000
+#how often queued messages are written out (ms)
+FLUSH_MS = 100
+#messages queued between flushes, past this the oldest are dropped and counted
+MAX_PENDING = 1000
+
 class ConsoleWindow(QWidget):
-    def __init__(self):
+    def __init__(self, level=INFO):
         super().__init__()
 
         self.layout = QVBoxLayout(self)
 
-        self.console_output = QTextEdit()
+        #lowest level that gets shown
+        self.level = level
+        self.levelSelector = QComboBox()
+        self.levelSelector.addItems(list(LEVEL_NAMES.values()))
+        self.levelSelector.setCurrentIndex(list(LEVEL_NAMES).index(level))
+        self.levelSelector.currentIndexChanged.connect(lambda i: self.set_level(list(LEVEL_NAMES)[i]))
+        self.layout.addWidget(self.levelSelector)
+
+        #plain text with a block limit, so appending stays cheap however long the session runs
+        self.console_output = QPlainTextEdit()
         self.console_output.setReadOnly(True)  # Make it read-only for output
+        self.console_output.setMaximumBlockCount(MAX_LINES)
         self.layout.addWidget(self.console_output)
 
+        #messages are queued and written out in one go on a timer instead of one append each
+        self.pending = deque(maxlen=MAX_PENDING)
+        self.dropped = 0
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start(FLUSH_MS)
+
         # Example: Writing to the console
-        self.console_output.append("GPS logger console initialized.")
-        
-    def log_message(self, message):
-        self.console_output.append(message)
\ No newline at end of file
+        self.console_output.appendPlainText("GPS logger console initialized.")
+
+    def set_level(self, level):
+        self.level = level
+
+    def enabled(self, level):
+        # lets callers skip building a message that would be dropped anyway
+        return level >= self.level
+
+    def log_message(self, message, level=INFO):
+        if level < self.level:
+            return
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        if level != INFO:
+            message = f"[{LEVEL_NAMES[level]}] {message}"
+        self.pending.append(message)
+
+    def flush(self):
+        if not self.pending:
+            return
+        lines = list(self.pending)
+        self.pending.clear()
+        if self.dropped:
+            lines.insert(0, f"[{LEVEL_NAMES[WARNING]}] {self.dropped} messages dropped, console could not keep up")
+            self.dropped = 0
+        self.console_output.appendPlainText("\n".join(lines))
@@ -0,0 +1,195 @@
+import asyncio
+import os
+from collections import namedtuple
+
+from telemetry import TelemetryStore, iter_file_chunks
+from ble_getter import DataGetter
+from simulator import SimulatedClient
+
+#what a file source yields: store is everything loaded so far and track the drawable track
+#built from it on the worker thread, both None unless the run has doubled since the last
+#batch that had them (the final one always has them), progress is the fraction of the file
+#read and final is set on the last one
+TrackBatch = namedtuple("TrackBatch", ["path", "store", "track", "progress", "final"])
+#loggers a BluetoothSource connects to at most, about what one BLE adapter can hold at once
+MAX_DEVICES = 7
+
+class DataSource:
+    """
+    Where the dashboard's data comes from. The window runs one source at a time:
+        if await source.open(logger):
+            async for batch in source.batches(): ...
+        await source.close(logger)
+    File sources yield TrackBatches, live ones SampleBatches (see
+    frame_decoder.py). Switching source cancels the loop and closes the old one.
+    """
+    name = "source"
+    #live sources get recorded to disk
+    live = False
+
+    async def open(self, logger=None):
+        return True
+
+    async def batches(self):
+        return
+        yield
+
+    async def close(self, logger=None):
+        pass
+
+    def stats(self):
+        return {}
+
+class FileSource(DataSource):
+    """
+    A logged run (.daq if there is one, csv otherwise), read a chunk at a time
+    on a worker thread so the start of the track shows while the rest loads.
+    make_track(store) builds the widget's track for a store, it is called on
+    the worker thread too, each time the run loaded so far has doubled and
+    once more for the whole run, so the GUI thread never builds one.
+    """
+    def __init__(self, path, make_track=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.make_track = make_track
+
+    async def batches(self):
+        chunks = iter_file_chunks(self.path)
+        stores = []
+        #the last track built and the store it was built from
+        built = [None, None]
+        loading = None
+        try:
+            while True:
+                #shielded so a cancelled load can let the chunk being read finish before closing the file
+                loading = asyncio.ensure_future(asyncio.to_thread(_load_chunk, chunks, stores, self.make_track, built))
+                loaded = await asyncio.shield(loading)
+                if loaded is None:
+                    break
+                yield TrackBatch(self.path, *loaded, False)
+            loading = asyncio.ensure_future(asyncio.to_thread(_finish_load, stores, self.make_track, built))
+            store, track = await asyncio.shield(loading)
+            yield TrackBatch(self.path, store, track, 1.0, True)
+        finally:
+            if loading is not None and not loading.done():
+                loading.add_done_callback(lambda task: _close_chunks(chunks, task))
+            else:
+                chunks.close()
+
+def _load_chunk(chunks, stores, make_track, built):
+    # next chunk of a run: (store so far, track, fraction loaded), None at the end of the file
+    item = next(chunks, None)
+    if item is None:
+        return None
+    chunk, done = item
+    stores.append(chunk)
+    #the chunks are only joined and the track built from scratch once the run has doubled
+    #since the last time, so the copying stays proportional to the length of the run
+    if built[1] is not None and sum(len(store) for store in stores) < 2 * len(built[1]):
+        return None, None, done
+    store = TelemetryStore.concat(stores)
+    stores[:] = [store]
+    return store, _build_track(store, make_track, built), done
+
+def _finish_load(stores, make_track, built):
+    # the whole run and its track, the last partial one is reused if nothing came in since
+    if built[1] is not None and sum(len(store) for store in stores) == len(built[1]):
+        return built[1], built[0]
+    store = TelemetryStore.concat(stores)
+    return store, _build_track(store, make_track, built)
+
+def _build_track(store, make_track, built):
+    track = make_track(store) if make_track is not None else None
+    built[:] = [track, store]
+    return track
+
+def _close_chunks(chunks, task):
+    # the load was cancelled, nothing wants the last chunk (or its error) any more
+    if not task.cancelled():
+        task.exception()
+    chunks.close()
+
+class BluetoothSource(DataSource):
+    """
+    Every logger whose name contains device_name, scanned for once this source
+    is started and all streamed at the same time, each getting its own
+    DataGetter (and so its own decoders and stats). Batches come out tagged
+    with the device they are from. clients can stand in for the BleakClients,
+    one per device (see SimulatorSource), then nothing is scanned for.
+    """
+    live = True
+
+    def __init__(self, device_name=DataGetter.DEVICE_ADDRESS, clients=None, max_devices=MAX_DEVICES):
+        self.name = device_name
+        self.device_name = device_name
+        self.clients = clients
+        self.max_devices = max_devices
+        self.data_getters = []
+        self.logger = None
+
+    async def open(self, logger=None):
+        self.logger = logger
+        if self.clients is not None:
+            getters = [DataGetter(client, label=f"{self.device_name} {i + 1}") for i, client in enumerate(self.clients)]
+        else:
+            devices = await DataGetter.find_devices(self.device_name, logger)
+            getters = [DataGetter(name=self.device_name, device=device) for device in devices[:self.max_devices]]
+            if not getters and logger:
+                logger.log_message("Target device not found.")
+
+        #connect to all of them at once, one that fails does not stop the rest
+        results = await asyncio.gather(*(getter.connect(logger=logger) for getter in getters), return_exceptions=True)
+        for getter, result in zip(getters, results):
+            if result is True:
+                self.data_getters.append(getter)
+            elif logger:
+                logger.log_message(f"Could not connect to {getter.label}: {result}")
+        return len(self.data_getters) > 0
+
+    async def batches(self):
+        #samples arrive as the devices notify them, no polling, each device's stream
+        #is pumped into one queue in the order its batches come in
+        merged = asyncio.Queue()
+
+        async def pump(getter):
+            try:
+                async for batch in getter.stream():
+                    merged.put_nowait(batch)
+            except Exception as e:
+                #e.g. start_notify failing on firmware without notify, the other devices keep streaming
+                message = f"{getter.label} stopped streaming: {e!r}"
+                if self.logger:
+                    self.logger.log_message(message)
+                else:
+                    print(message)
+            finally:
+                merged.put_nowait(None)
+
+        pumps = [asyncio.ensure_future(pump(getter)) for getter in self.data_getters]
+        try:
+            running = len(pumps)
+            while running:
+                batch = await merged.get()
+                if batch is None:
+                    running -= 1
+                else:
+                    yield batch
+        finally:
+            for task in pumps:
+                task.cancel()
+
+    async def close(self, logger=None):
+        await asyncio.gather(*(getter.disconnect(logger=logger) for getter in self.data_getters))
+
+    def stats(self):
+        # per device, per characteristic stats (see FrameDecoder.stats)
+        return {getter.label: getter.stats() for getter in self.data_getters}
+
+class SimulatorSource(BluetoothSource):
+    """
+    A logged run replayed through the BLE path by SimulatedClients, one per
+    simulated car, each starting a different way into the run.
+    """
+    def __init__(self, path, rate=1.0, cars=1):
+        super().__init__("sim car", clients=[SimulatedClient(path, rate, start=i / cars) for i in range(cars)])
+        self.name = f"simulator ({os.path.basename(path)} at {rate}x, {cars} car{'s' if cars > 1 else ''})"
@@ -0,0 +1,42 @@
+from PySide6.QtCore import QObject, QTimer, Qt, Signal
+
+#frames per second the dashboard repaints at, however fast data comes in
+DEFAULT_FPS = 60
+
+class FrameClock(QObject):
+    """
+    One render clock for the whole window. Widgets call mark_dirty(self) when
+    their data changes instead of update(), and every dirty widget gets a
+    single update() per tick, so a burst of data between two frames costs one
+    repaint per widget. tick is emitted at the start of each frame, before the
+    repaints, for anything that wants to advance once per frame (e.g. playback).
+    """
+    tick = Signal()
+
+    def __init__(self, fps=DEFAULT_FPS, parent=None):
+        super().__init__(parent)
+        self.dirty = set()
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.on_tick)
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.timer.setInterval(max(1, round(1000 / fps)))
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def mark_dirty(self, widget):
+        self.dirty.add(widget)
+
+    def on_tick(self):
+        self.tick.emit()
+        dirty = self.dirty
+        self.dirty = set()
+        for widget in dirty:
+            widget.update()
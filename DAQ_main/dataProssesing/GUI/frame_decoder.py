@@ -0,0 +1,183 @@
+import struct
+from collections import namedtuple
+import numpy as np
+
+#decoding of the GPS / IMU characteristic payloads into column buffers
+#two payload layouts are understood:
+#   legacy, what DAQ_main.ino sends now: one sample of little endian float32s and nothing else
+#   framed: a FRAME_HEADER (kind, sample count, sequence number) then count records of
+#           uint32 device millis + the float32s, so one notification can carry several samples
+#framed payloads are decoded with one numpy.frombuffer per notification, no per sample Python objects
+
+#what the ESP32 sends on each characteristic (see DAQ_main.ino)
+GPS_FIELDS = ("lat", "lon")
+#same order as the first 12 dataLabels columns in fileSpliter.py
+IMU_FIELDS = ("yaw_deg", "roll_deg", "pitch_deg", "ax_b", "ay_b", "az_b", "ax_w", "ay_w", "vx_imu", "vy_imu", "x_imu", "y_imu")
+GPS_STRUCT = struct.Struct("<" + "f" * len(GPS_FIELDS))
+IMU_STRUCT = struct.Struct("<" + "f" * len(IMU_FIELDS))
+
+#kind (uint8), sample count (uint8), sequence number (uint16, wraps)
+FRAME_HEADER = struct.Struct("<BBH")
+KIND_GPS = 1
+KIND_IMU = 2
+SEQ_MODULO = 1 << 16
+#rows the column buffers start out with, they double when a burst does not fit
+INITIAL_CAPACITY = 1024
+
+#decoded samples of one kind ("gps" / "imu"): time is a float64 array of ms, device millis
+#for framed payloads and host time.monotonic() ms for legacy ones, values is a float32 array
+#with one row per sample and one column per field, device says which logger sent them
+#(None when there is only the one)
+SampleBatch = namedtuple("SampleBatch", ["kind", "time", "values", "device"], defaults=[None])
+
+def record_dtype(fields):
+    return np.dtype([("millis", "<u4"), ("values", "<f4", (len(fields),))])
+
+class ColumnBuffer:
+    """
+    Preallocated time / value columns that decoded samples are copied straight into.
+    drain() hands back everything since the last drain and reuses the space.
+    """
+    def __init__(self, fields, capacity=INITIAL_CAPACITY):
+        self.fields = fields
+        self.time = np.empty(capacity)
+        self.values = np.empty((capacity, len(fields)), dtype=np.float32)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, n):
+        if self.count + n <= len(self.time):
+            return
+        capacity = max(len(self.time) * 2, self.count + n)
+        time = np.empty(capacity)
+        values = np.empty((capacity, len(self.fields)), dtype=np.float32)
+        time[:self.count] = self.time[:self.count]
+        values[:self.count] = self.values[:self.count]
+        self.time = time
+        self.values = values
+
+    def append(self, time, values):
+        n = len(values)
+        self.reserve(n)
+        self.time[self.count:self.count + n] = time
+        self.values[self.count:self.count + n] = values
+        self.count += n
+
+    def drain(self):
+        time = self.time[:self.count].copy()
+        values = self.values[:self.count].copy()
+        self.count = 0
+        return time, values
+
+class FrameDecoder:
+    """
+    Decodes one characteristic's payloads into a ColumnBuffer and keeps count of
+    frames, samples, frames lost (gaps in the sequence numbers) and payloads
+    that could not be decoded, plus the arrival timing stats() reports.
+    """
+    def __init__(self, name, kind, fields, device=None):
+        self.name = name
+        self.kind = kind
+        self.device = device
+        self.buffer = ColumnBuffer(fields)
+        self.record = record_dtype(fields)
+        self.legacy_size = 4 * len(fields)
+        self.last_seq = None
+        self.frames = 0
+        self.samples = 0
+        self.lost = 0
+        self.bad = 0
+        #host ms of the first / last payload and the longest wait between two
+        self.first_received = None
+        self.last_received = None
+        self.max_gap = 0.0
+        #framed payloads only: host time minus device millis, the smallest seen is taken as
+        #the clock offset and anything above it as delay on the way in
+        self.min_offset = None
+        self.delay = None
+
+    def _arrived(self, received_ms):
+        if self.last_received is None:
+            self.first_received = received_ms
+        else:
+            self.max_gap = max(self.max_gap, received_ms - self.last_received)
+        self.last_received = received_ms
+
+    def feed(self, data, received_ms):
+        """
+        Decodes one payload, received_ms is the host time it arrived.
+        Returns how many samples it held.
+        """
+        size = len(data)
+        if size == self.legacy_size:
+            self._arrived(received_ms)
+            self.buffer.append(received_ms, np.frombuffer(data, dtype="<f4").reshape(1, -1))
+            self.frames += 1
+            self.samples += 1
+            return 1
+
+        if size < FRAME_HEADER.size:
+            # e.g. the single zero byte the characteristics start out with
+            self.bad += 1
+            return 0
+        kind, count, seq = FRAME_HEADER.unpack_from(data)
+        if kind != self.kind or size != FRAME_HEADER.size + count * self.record.itemsize:
+            self.bad += 1
+            return 0
+
+        if self.last_seq is not None:
+            self.lost += (seq - self.last_seq - 1) % SEQ_MODULO
+        self.last_seq = seq
+        records = np.frombuffer(data, dtype=self.record, count=count, offset=FRAME_HEADER.size)
+        self.buffer.append(records["millis"], records["values"])
+        self._arrived(received_ms)
+        if count:
+            offset = received_ms - float(records["millis"][-1])
+            if self.min_offset is None or offset < self.min_offset:
+                self.min_offset = offset
+            self.delay = offset - self.min_offset
+        self.frames += 1
+        self.samples += count
+        return count
+
+    def drain(self):
+        # SampleBatch of everything decoded since the last drain, None if nothing was
+        if len(self.buffer) == 0:
+            return None
+        time, values = self.buffer.drain()
+        return SampleBatch(self.name, time, values, self.device)
+
+    def stats(self):
+        span = (self.last_received - self.first_received) / 1000 if self.samples > 1 else 0
+        return {
+            "samples": self.samples,
+            "rate_hz": (self.samples - 1) / span if span > 0 else 0.0,
+            "max_gap_ms": self.max_gap,
+            "delay_ms": self.delay,
+            "lost": self.lost,
+            "bad": self.bad,
+        }
+
+def encode_frame(kind, seq, millis, values):
+    """
+    Packs samples the way a framed payload is laid out, for devices (or the
+    simulator) that batch several samples per notification.
+    """
+    values = np.asarray(values, dtype="<f4")
+    records = np.empty(len(values), dtype=record_dtype(range(values.shape[1])))
+    records["millis"] = millis
+    records["values"] = values
+    return FRAME_HEADER.pack(kind, len(values), seq % SEQ_MODULO) + records.tobytes()
+
+def decode_gps(data):
+    # (lat, lon), None until the device has written a full fix (it starts out as one zero byte)
+    if len(data) != GPS_STRUCT.size:
+        return None
+    return GPS_STRUCT.unpack(data)
+
+def decode_imu(data):
+    if len(data) != IMU_STRUCT.size:
+        return None
+    return IMU_STRUCT.unpack(data)
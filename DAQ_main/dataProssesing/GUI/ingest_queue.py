@@ -0,0 +1,122 @@
+import asyncio
+from collections import deque
+
+#what a full queue does with the next batch:
+#   drop_oldest: throw away the oldest queued batch to make room (consumers see the latest data)
+#   drop_newest: throw away the incoming batch (consumers see an unbroken run, then a gap)
+#the producer never waits on a consumer either way, acquisition can not be stalled by a slow one
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+#batches a queue holds before its policy kicks in
+DEFAULT_MAXSIZE = 256
+
+def batch_samples(batch):
+    # samples in a SampleBatch, a file source's TrackBatch has none of its own (its store is
+    # everything loaded so far, the next one carries whatever a dropped one had)
+    time = getattr(batch, "time", None)
+    return 0 if time is None else len(time)
+
+class IngestQueue:
+    """
+    Bounded queue of SampleBatches (see frame_decoder.py), or a file source's
+    TrackBatches, for one consumer.
+    put() never blocks, when the queue is full a batch is dropped according to
+    the policy and counted. Consumers read it at their own pace with:
+        async for batch in queue: ...
+    which ends once the queue is closed and empty.
+    """
+    def __init__(self, name, maxsize=DEFAULT_MAXSIZE, policy=DROP_OLDEST):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"unknown drop policy {policy!r}, expected one of {DROP_POLICIES}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        #overflow counters, batches and the samples in them
+        self.received = 0
+        self.dropped = 0
+        self.dropped_samples = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, batch):
+        # returns False if the batch (or an older one, for drop_oldest) had to be dropped
+        self.received += 1
+        kept = True
+        if len(self.items) >= self.maxsize:
+            if self.policy == DROP_NEWEST:
+                self._drop(batch)
+                return False
+            self._drop(self.items.popleft())
+            kept = False
+        self.items.append(batch)
+        self.high_water = max(self.high_water, len(self.items))
+        self.ready.set()
+        return kept
+
+    def _drop(self, batch):
+        self.dropped += 1
+        self.dropped_samples += batch_samples(batch)
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    async def __aiter__(self):
+        while True:
+            while self.items:
+                yield self.items.popleft()
+                #hand the loop back between batches so a backlog can not starve the producer
+                await asyncio.sleep(0)
+            if self.closed:
+                return
+            self.ready.clear()
+            await self.ready.wait()
+
+    def stats(self):
+        return {
+            "queued": len(self.items),
+            "received": self.received,
+            "dropped": self.dropped,
+            "dropped_samples": self.dropped_samples,
+            "high_water": self.high_water,
+            "policy": self.policy,
+        }
+
+class IngestBus:
+    """
+    Fans the batches a data source produces out to every subscribed consumer
+    (dashboard, recorder, analysis ...), each through its own IngestQueue so
+    one falling behind only costs that consumer data.
+    """
+    def __init__(self):
+        self.queues = {}
+
+    def subscribe(self, name, maxsize=DEFAULT_MAXSIZE, policy=DROP_OLDEST):
+        if name in self.queues:
+            raise ValueError(f"{name!r} is already subscribed")
+        queue = IngestQueue(name, maxsize, policy)
+        self.queues[name] = queue
+        return queue
+
+    def unsubscribe(self, name):
+        queue = self.queues.pop(name, None)
+        if queue is not None:
+            queue.close()
+
+    def publish(self, batch):
+        for queue in self.queues.values():
+            queue.put(batch)
+
+    def close(self):
+        # ends every consumer's loop once it has read what is still queued
+        for queue in self.queues.values():
+            queue.close()
+
+    def stats(self):
+        return {name: queue.stats() for name, queue in self.queues.items()}
@@ -3,17 +3,38 @@
 import asyncio
 
 import math
+import os
 import sys
+import numpy as np
+
+#run file helpers (runFile.py etc.) are shared with the analysis scripts one folder up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sideBar import Sidebar
 from GPSDisplay import GPSWidget
 from console import ConsoleWindow
-from ble_getter import DataGetter
-from speedometer import SpeedometerWidget
+from frame_decoder import GPS_FIELDS, IMU_FIELDS
+from console import DEBUG, WARNING, ERROR
+from data_source import BluetoothSource, FileSource, SimulatorSource, TrackBatch
+from ingest_queue import DROP_NEWEST, DROP_OLDEST, IngestBus
+from recorder import RECORD_DIR, SessionRecorder
+from simulator import SIM_RATES
+from speedometer import MAX_MODES, SpeedometerWidget
 from acceleration_chart import AccelerationChart
-from PySide6.QtCore import Qt, Signal
-from PySide6.QtWidgets import QApplication, QMainWindow, QHBoxLayout, QWidget, QPushButton, QVBoxLayout, QSplitter
+from frame_clock import DEFAULT_FPS, FrameClock
+from playback_clock import PLAYBACK_RATES
+from PySide6.QtCore import Qt, QTimer, Signal
+from PySide6.QtWidgets import QApplication, QMainWindow, QHBoxLayout, QWidget, QPushButton, QVBoxLayout, QSplitter, QSlider, QComboBox
 from qasync import QEventLoop, asyncSlot
 
+#the dashboard only shows the latest values, so when it falls behind old batches are dropped
+DASHBOARD_QUEUE_SIZE = 64
+DASHBOARD_DROP_POLICY = DROP_OLDEST
+#the recorder wants every sample, a deep queue rides out slow disks and a full one keeps the run unbroken up to the gap
+RECORDER_QUEUE_SIZE = 4096
+RECORDER_DROP_POLICY = DROP_NEWEST
+#how often the per device stats in the car selector are refreshed (ms)
+DEVICE_STATS_MS = 1000
+
 #color pallette
 background = "#0F0000"
 buttons = "#90E2DD"
@@ -23,6 +44,11 @@ class MainWindow(QMainWindow):
     loaded_file_path = None
     gps_updated = Signal(str)
     sourceType = "Bluetooth"
+    simulatorRate = SIM_RATES[0]
+    simulatorCars = 1
+    #task running the current DataSource, one source at a time
+    source_task = None
+    source = None
     playback = Signal(bool)
 
     spliter_syle = f"""
@@ -40,10 +66,15 @@ class MainWindow(QMainWindow):
                 margin: 2px;
             }}
         """
-    def __init__(self):
+    def __init__(self, fps=DEFAULT_FPS):
         super().__init__()
         self.setWindowTitle("Data Processor")
 
+        #data updates only mark widgets dirty, they all repaint together once per frame
+        self.frame_clock = FrameClock(fps, self)
+        #live data sources publish their batches here, consumers subscribe with their own queue
+        self.ingest = IngestBus()
+
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
 
@@ -64,6 +95,9 @@ class MainWindow(QMainWindow):
         #connect sidebar signals to main window slots
         self.sidebar.sourceType.connect(self.handle_type_selected)
         self.sidebar.sourceFile.connect(self.handle_file_selected)
+        self.sidebar.simulatorRate.connect(self.handle_simulator_rate)
+        self.sidebar.simulatorCars.connect(self.handle_simulator_cars)
+        self.sidebar.bleConnect.connect(self.handle_ble_connect)
 
         middleSpliter = QSplitter(Qt.Vertical)
         content = QWidget()
@@ -79,6 +113,21 @@ class MainWindow(QMainWindow):
         playbackLayout = QHBoxLayout(self.buttonContent)
         playbackLayout.addWidget(self.playbackButton)
         playbackLayout.addWidget(self.pausePlaybackButton)
+
+        #playback speed, log time per real time
+        self.rateSelector = QComboBox()
+        self.rateSelector.addItems([f"{rate:g}x" for rate in PLAYBACK_RATES])
+        self.rateSelector.setCurrentIndex(PLAYBACK_RATES.index(1))
+        self.rateSelector.currentIndexChanged.connect(self.set_playback_rate)
+        playbackLayout.addWidget(self.rateSelector)
+
+        #timeline scrubber, values are the run's time in ms
+        self.scrubber = QSlider(Qt.Horizontal)
+        self.scrubber.setEnabled(False)
+        self.scrubber.valueChanged.connect(self.GPSDisplay.seek_time)
+        self.GPSDisplay.time_range_changed.connect(self.set_scrubber_range)
+        self.GPSDisplay.time_changed.connect(self.set_scrubber_time)
+        playbackLayout.addWidget(self.scrubber)
         content_layout.addWidget(self.buttonContent)
 
         console_widget = QWidget()
@@ -94,22 +143,149 @@ class MainWindow(QMainWindow):
         splitter.addWidget(middleSpliter)
 
         rightSideSlider = QSplitter(Qt.Vertical)
-        self.speedometer = SpeedometerWidget(self.GPSDisplay, main_window=self)
         rightSideSlider.setFixedWidth(350)
+
+        #which car the dashboard shows when several loggers are live, with each one's stats
+        self.deviceSelector = QComboBox()
+        self.deviceSelector.setMaximumHeight(50)
+        self.deviceSelector.currentIndexChanged.connect(self.handle_device_selected)
+        rightSideSlider.addWidget(self.deviceSelector)
+        #device label the speedometer follows, None until the first live batch
+        self.selected_device = None
+        self.device_stats_timer = QTimer(self)
+        self.device_stats_timer.timeout.connect(self.update_device_stats)
+        self.device_stats_timer.start(DEVICE_STATS_MS)
+
+        self.speedometer = SpeedometerWidget(self.GPSDisplay, main_window=self)
         rightSideSlider.addWidget(self.speedometer)
 
-        self.acceleration_chart = AccelerationChart(self.GPSDisplay)
+        #what the speedometer's max arc tracks
+        self.maxContent = QWidget()
+        self.maxContent.setMaximumHeight(50)
+        maxLayout = QHBoxLayout(self.maxContent)
+        self.maxModeSelector = QComboBox()
+        self.maxModeSelector.addItems(["Max: last 10 s", "Max: session", "Max: lap"])
+        self.maxModeSelector.currentIndexChanged.connect(lambda i: self.speedometer.set_max_mode(MAX_MODES[i]))
+        self.newLapButton = QPushButton("new lap")
+        self.newLapButton.clicked.connect(self.speedometer.new_lap)
+        maxLayout.addWidget(self.maxModeSelector)
+        maxLayout.addWidget(self.newLapButton)
+        rightSideSlider.addWidget(self.maxContent)
+
+        self.acceleration_chart = AccelerationChart(self.GPSDisplay, self.frame_clock)
         self.GPSDisplay.output_acceleration.connect(self.acceleration_chart.add_acceleration)
         rightSideSlider.addWidget(self.acceleration_chart)
         splitter.addWidget(rightSideSlider)
 
+        self.frame_clock.start()
+
     def handle_type_selected(self, mode):
         print(f"MainWindow opperating using: {mode} mode")
         self.sourceType = mode
+        #whatever was running belongs to the old source type
+        self.stop_source()
+
+    def handle_simulator_rate(self, rate):
+        self.simulatorRate = rate
+
+    def handle_simulator_cars(self, cars):
+        self.simulatorCars = cars
+
+    def add_device(self, device):
+        # first batch from a logger, the first one is shown until another is picked
+        self.deviceSelector.addItem(device, device)
+        if self.selected_device is None:
+            self.selected_device = device
+
+    def handle_device_selected(self, index):
+        device = self.deviceSelector.itemData(index)
+        if device is not None and device != self.selected_device:
+            self.selected_device = device
+            #the max arc, map and chart should not carry another car's data over
+            self.speedometer.reset_max()
+            self.clear_live_widgets()
+
+    def clear_devices(self):
+        self.selected_device = None
+        self.deviceSelector.clear()
+
+    def clear_live_widgets(self):
+        self.GPSDisplay.start_live()
+        self.acceleration_chart.clear()
+        self.frame_clock.mark_dirty(self.acceleration_chart)
+
+    def update_device_stats(self):
+        if self.source is None or not self.source.live:
+            return
+        stats = self.source.stats()
+        for i in range(self.deviceSelector.count()):
+            device = self.deviceSelector.itemData(i)
+            imu = stats.get(device, {}).get("imu")
+            if imu is None:
+                continue
+            text = f"{device}: {imu['rate_hz']:.0f} Hz, max gap {imu['max_gap_ms']:.0f} ms, {imu['lost']} lost"
+            if imu["delay_ms"] is not None:
+                text += f", {imu['delay_ms']:.0f} ms delay"
+            self.deviceSelector.setItemText(i, text)
+
+    def handle_ble_connect(self, device_name):
+        #the device is only scanned for once asked to, not at startup
+        self.start_source(BluetoothSource(device_name))
 
     def handle_file_selected(self, path):
+        if self.sourceType == "Simulator":
+            print(f"MainWindow simulating BLE from: {path}")
+            self.start_source(SimulatorSource(path, self.simulatorRate, self.simulatorCars))
+            return
         print(f"MainWindow loaded file: {path}")
         self.loaded_file_path = path
+        #read in the background, picking a new file cancels the old load
+        self.start_source(FileSource(path, self.GPSDisplay.make_track))
+
+    def start_source(self, source):
+        # replaces whatever source is running
+        previous = self.stop_source()
+        self.source_task = asyncio.ensure_future(self.switch_source(source, previous))
+
+    def stop_source(self):
+        # returns the cancelled source's task, it still has to clean up
+        previous = self.source_task
+        if previous is not None:
+            previous.cancel()
+            self.source_task = None
+        return previous
+
+    async def switch_source(self, source, previous):
+        if previous is not None:
+            #the old source has to give up the device and its ingest queues first
+            await asyncio.gather(previous, return_exceptions=True)
+        if isinstance(source, FileSource):
+            #widgets clear the old run out of the way before the new one's batches come in
+            self.gps_updated.emit(source.path)
+        self.clear_devices()
+        if source.live:
+            self.clear_live_widgets()
+        self.source = source
+        try:
+            await run_source(self, source)
+        finally:
+            if self.source is source:
+                self.source = None
+
+    def set_scrubber_range(self, start, end):
+        self.scrubber.blockSignals(True)
+        self.scrubber.setRange(start, end)
+        self.scrubber.blockSignals(False)
+        self.scrubber.setEnabled(True)
+
+    def set_scrubber_time(self, t):
+        #moving the slider to follow playback should not seek again
+        self.scrubber.blockSignals(True)
+        self.scrubber.setValue(t)
+        self.scrubber.blockSignals(False)
+
+    def set_playback_rate(self, index):
+        self.GPSDisplay.set_playback_rate(PLAYBACK_RATES[index])
 
     def start_playback(self):
         self.playback.emit(True)
@@ -117,44 +293,93 @@ class MainWindow(QMainWindow):
     def pause_playback(self):
         self.playback.emit(False)
 
-def emit_GPS_pos_from_file(window):
-    window.gps_updated.emit(window.loaded_file_path)
-
-async def async_update_GPS_pos(window):
-    window.text_console.log_message("seting up GPS data loging from file")
-
-    while True:
-        await asyncio.sleep(0.5)
-        if(window.loaded_file_path != None):
-            window.text_console.log_message(f"loading GPS position from {window.loaded_file_path}")
-            break
-
-    emit_GPS_pos_from_file(window)
-
-async def async_ble_loop(window):
-    data_getter = DataGetter()
-    connected = await data_getter.connect(logger=window.text_console)
-    window.text_console.log_message("seting up BLE data streaming")
-
-    if not connected:
-        window.text_console.log_message("Failed to connect BLE")
-        return
-
+async def run_source(window, source):
+    #producer: only moves the source's batches onto the bus, it never waits on a consumer
     try:
-        while True:
-            gps_data = await data_getter.read_gps_status()
-            imu_data = await data_getter.read_imu_data()
-
-            window.text_console.log_message(f"GPS Data: {gps_data}")
-            window.text_console.log_message(f"IMU Data: {imu_data}")
+        opened = await source.open(logger=window.text_console)
+    except Exception as e:
+        #no bluetooth adapter, unreadable file ... the window keeps running either way
+        window.text_console.log_message(f"could not open {source.name}: {e}", ERROR)
+        return
+    if not opened:
+        window.text_console.log_message(f"Failed to connect to {source.name}")
+        return
 
-            speed = math.sqrt(gps_data["vx"]**2 + gps_data["vy"]**2)
+    #consumers subscribe per source, so each one starts with fresh queues and counters
+    dashboard_queue = window.ingest.subscribe("dashboard", DASHBOARD_QUEUE_SIZE, DASHBOARD_DROP_POLICY)
+    dashboard = asyncio.ensure_future(dashboard_consumer(window, dashboard_queue))
 
-            window.GPSDisplay.speedometer.set_speed(speed)
+    recorder = None
+    if source.live:
+        #everything received is also written to disk, a file per device, so a session survives the app closing or crashing
+        recorder = SessionRecorder()
+        recorder_queue = window.ingest.subscribe("recorder", RECORDER_QUEUE_SIZE, RECORDER_DROP_POLICY)
+        recording = asyncio.ensure_future(recorder.run(recorder_queue))
+        window.text_console.log_message(f"streaming from {source.name}, recording to {RECORD_DIR}")
 
-            await asyncio.sleep(0.5)  # poll every 0.5 seconds
+    cancelled = False
+    try:
+        async for batch in source.batches():
+            window.ingest.publish(batch)
+    except asyncio.CancelledError:
+        #switched to another source (or source type) part way through
+        cancelled = True
+        raise
+    except (OSError, ValueError) as e:
+        if isinstance(source, FileSource):
+            window.GPSDisplay.on_load_failed(str(e))
+        else:
+            window.text_console.log_message(f"{source.name} failed: {e}", ERROR)
     finally:
-        await data_getter.disconnect(logger=window.text_console)
+        window.ingest.unsubscribe("dashboard")
+        if recorder is not None:
+            window.ingest.unsubscribe("recorder")
+        await source.close(logger=window.text_console)
+        await dashboard
+        if cancelled and isinstance(source, FileSource):
+            #after the dashboard is drained, a final batch still queued finishes the load instead
+            window.GPSDisplay.on_load_cancelled()
+        if recorder is not None:
+            await recording
+            for device_recorder in recorder.recorders.values():
+                window.text_console.log_message(f"recorded {device_recorder.rows_written} rows to {device_recorder.path}")
+            window.text_console.log_message(f"recorder ingest: {recorder_queue.stats()}")
+
+async def dashboard_consumer(window, queue):
+    # every widget is fed from this one stream, whatever the source
+    dropped = 0
+    devices = set()
+    #the selected car's latest speed, GPS fixes are colored with it on the map
+    speed = 0.0
+    async for batch in queue:
+        if isinstance(batch, TrackBatch):
+            window.GPSDisplay.on_track_batch(batch)
+        else:
+            if window.text_console.enabled(DEBUG):
+                window.text_console.log_message(f"{len(batch.time)} {batch.kind} samples, last: {batch.values[-1]}", DEBUG)
+
+            if batch.device not in devices:
+                devices.add(batch.device)
+                window.add_device(batch.device)
+
+            #several cars can be live, the dashboard shows the one picked in the car selector
+            if batch.device == window.selected_device:
+                if batch.kind == "imu":
+                    vx = batch.values[-1, IMU_FIELDS.index("vx_imu")]
+                    vy = batch.values[-1, IMU_FIELDS.index("vy_imu")]
+                    speed = math.sqrt(vx**2 + vy**2)
+                    window.speedometer.set_speed(speed, batch.time[-1])
+                    #same acceleration the chart shows during file playback (see telemetry.COLUMN_KEYS)
+                    window.acceleration_chart.add_samples(batch.time, np.hypot(batch.values[:, IMU_FIELDS.index("ax_w")],
+                                                                               batch.values[:, IMU_FIELDS.index("ay_w")]))
+                else:
+                    window.GPSDisplay.on_live_fixes(batch.values[:, GPS_FIELDS.index("lat")],
+                                                    batch.values[:, GPS_FIELDS.index("lon")], speed)
+
+        if queue.dropped != dropped:
+            window.text_console.log_message(f"dashboard fell behind, {queue.dropped - dropped} batches dropped", WARNING)
+            dropped = queue.dropped
+    window.text_console.log_message(f"dashboard ingest: {queue.stats()}", DEBUG)
 
 def main():
     app = QApplication(sys.argv)
@@ -165,9 +390,6 @@ def main():
     loop = QEventLoop(app)
     asyncio.set_event_loop(loop)
 
-    loop.create_task(async_ble_loop(window))
-    loop.create_task(async_update_GPS_pos(window))
-
     with loop:
         loop.run_forever()
 
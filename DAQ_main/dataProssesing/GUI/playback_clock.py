@@ -0,0 +1,42 @@
+import time
+
+#playback rates offered in the GUI, log seconds per real second
+PLAYBACK_RATES = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+
+class PlaybackClock:
+    """
+    Maps real time onto log time (ms, same as the millis column) at a chosen rate.
+    It only keeps the log time and monotonic wall time it was last anchored at,
+    so pausing, seeking and changing rate never drift however long playback runs.
+    """
+    def __init__(self, rate=1.0):
+        self.rate = rate
+        self.playing = False
+        self.anchor_log = 0
+        self.anchor_wall = time.monotonic()
+
+    def log_time(self):
+        if not self.playing:
+            return self.anchor_log
+        return self.anchor_log + (time.monotonic() - self.anchor_wall) * 1000 * self.rate
+
+    def _anchor(self, log_time):
+        self.anchor_log = log_time
+        self.anchor_wall = time.monotonic()
+
+    def play(self):
+        if not self.playing:
+            self._anchor(self.anchor_log)
+            self.playing = True
+
+    def pause(self):
+        if self.playing:
+            self._anchor(self.log_time())
+            self.playing = False
+
+    def seek(self, log_time):
+        self._anchor(log_time)
+
+    def set_rate(self, rate):
+        self._anchor(self.log_time())
+        self.rate = rate
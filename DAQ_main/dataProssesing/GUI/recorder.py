@@ -0,0 +1,201 @@
+import asyncio
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from fileSpliter import dataLabels
+from frame_decoder import GPS_FIELDS, IMU_FIELDS
+
+#live runs are written as csv with fileSpliter's dataLabels header, so they load and split like any logged run
+RECORD_DIR = "recordings"
+#a block is written and fsynced once it has this many rows or is this old (ms), whichever comes first
+BLOCK_ROWS = 2000
+BLOCK_MS = 1000
+#digits kept for the float columns, enough to round trip a float32 (lat / lon to about 1e-7 degrees)
+FLOAT_FORMAT = "%.9g"
+
+#only the columns the device sends are kept, the rest are written as empty cells
+_RECORDED = (*IMU_FIELDS, *GPS_FIELDS, "millis")
+_IMU_COLUMNS = [_RECORDED.index(name) for name in IMU_FIELDS]
+_GPS_COLUMNS = [_RECORDED.index(name) for name in GPS_FIELDS]
+_MILLIS_COLUMN = _RECORDED.index("millis")
+#one csv line in dataLabels order, a whole block is formatted with a single % on this repeated
+_ROW_FORMAT = ",".join("%d" if name == "millis" else FLOAT_FORMAT if name in _RECORDED else ""
+                       for name in dataLabels) + "\n"
+
+def recording_path(directory=RECORD_DIR, device=None):
+    # one file per logger when there are several, named after it
+    name = datetime.now().strftime("live_%Y%m%d_%H%M%S")
+    if device is not None:
+        name += "_" + re.sub(r"[^A-Za-z0-9]+", "_", device).strip("_")
+    return os.path.join(directory, name + ".csv")
+
+def recover(path):
+    """
+    Makes a recording left behind by a crash readable again by cutting off
+    whatever follows the last complete line (a torn row, or the zeros some
+    filesystems leave after a power cut). Returns the bytes cut off.
+    """
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        #walk back a chunk at a time, the torn part is never longer than a block
+        while end > 0:
+            start = max(0, end - 64 * 1024)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+    return size - end
+
+class LiveRecorder:
+    """
+    Appends live samples to a csv run file in blocks. IMU samples become rows
+    with the latest GPS fix carried along, GPS samples only update that fix
+    (they are drained ahead of the IMU ones, rows of their own would put
+    millis out of order and fileSpliter would see a reset). Columns the
+    device does not send are left empty.
+
+    Rows are collected in memory and every block is formatted, written and
+    fsynced on a single writer thread, one block at a time and in order, so
+    the event loop never waits on the disk. After a crash the file holds every
+    block up to the last complete one, recover() trims anything after it.
+    """
+    def __init__(self, path, block_rows=BLOCK_ROWS, block_ms=BLOCK_MS):
+        self.path = path
+        self.block_rows = block_rows
+        self.block_ms = block_ms
+        self.blocks = []
+        self.block_len = 0
+        self.block_started = None
+        self.last_fix = np.full(len(GPS_FIELDS), np.nan)
+        self.rows_written = 0
+        self.blocks_written = 0
+        self.closed = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recorder")
+        #opened on the writer thread too, the first flush waits on it like on any earlier block
+        self.file = None
+        self.writing = asyncio.wrap_future(self.executor.submit(self._open))
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            #carrying on with an old recording, drop its torn tail first
+            recover(self.path)
+            self.file = open(self.path, "ab")
+            return
+        self.file = open(self.path, "ab")
+        self.file.write((",".join(dataLabels) + "\n").encode())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def add(self, batch):
+        """
+        Turns a SampleBatch into rows for the current block.
+        Returns True once the block is due to be written.
+        """
+        if batch.kind != "imu":
+            if len(batch.time):
+                self.last_fix = batch.values[-1].astype(float)
+            return False
+
+        rows = np.empty((len(batch.time), len(_RECORDED)))
+        rows[:, _MILLIS_COLUMN] = batch.time
+        rows[:, _IMU_COLUMNS] = batch.values
+        rows[:, _GPS_COLUMNS] = self.last_fix
+
+        if self.block_started is None:
+            self.block_started = time.monotonic()
+        self.blocks.append(rows)
+        self.block_len += len(rows)
+        return (self.block_len >= self.block_rows
+                or (time.monotonic() - self.block_started) * 1000 >= self.block_ms)
+
+    async def flush(self):
+        # waits for the block before it, so at most one block is ever in flight
+        if self.writing is not None:
+            await self.writing
+            self.writing = None
+        if not self.blocks:
+            return
+        rows = np.concatenate(self.blocks)
+        self.blocks = []
+        self.block_len = 0
+        self.block_started = None
+        self.writing = asyncio.get_running_loop().run_in_executor(self.executor, self._write_block, rows)
+
+    def _write_block(self, rows):
+        rows[:, _MILLIS_COLUMN] = rows[:, _MILLIS_COLUMN].round()
+        #values that are not there yet (no GPS fix) come out as nan, they are written as empty cells
+        text = (_ROW_FORMAT * len(rows) % tuple(rows.ravel().tolist())).replace("nan", "")
+        #one write per block then fsync, a crash can only tear the block being written
+        self.file.write(text.encode())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.rows_written += len(rows)
+        self.blocks_written += 1
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+
+    async def run(self, queue):
+        """
+        Consumer loop: records every batch from an IngestQueue until it is closed,
+        then writes out what is left and closes the file.
+        """
+        try:
+            async for batch in queue:
+                if self.add(batch):
+                    await self.flush()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        await self.flush()
+        if self.writing is not None:
+            await self.writing
+            self.writing = None
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._close_file)
+        self.executor.shutdown()
+
+class SessionRecorder:
+    """
+    Consumer that gives every device in a live session its own LiveRecorder,
+    started the first time a batch from it comes in, so runs from several
+    cars never end up interleaved in one file.
+    """
+    def __init__(self, directory=RECORD_DIR):
+        self.directory = directory
+        self.recorders = {}
+
+    def recorder_for(self, device):
+        recorder = self.recorders.get(device)
+        if recorder is None:
+            recorder = LiveRecorder(recording_path(self.directory, device))
+            self.recorders[device] = recorder
+        return recorder
+
+    async def run(self, queue):
+        try:
+            async for batch in queue:
+                recorder = self.recorder_for(batch.device)
+                if recorder.add(batch):
+                    await recorder.flush()
+        finally:
+            await asyncio.gather(*(recorder.close() for recorder in self.recorders.values()))
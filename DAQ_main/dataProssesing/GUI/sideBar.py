@@ -1,12 +1,21 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QFileDialog, QComboBox, QLabel, QTextEdit, QPushButton
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QFileDialog, QComboBox, QLabel, QTextEdit, QPushButton, QSpinBox
 from PySide6.QtCore import Signal
 import os
+from simulator import SIM_RATES
+from ble_getter import DataGetter
+from data_source import MAX_DEVICES
 
 class Sidebar(QWidget):
     sourceType = Signal(str)
 
     sourceFile = Signal(str)
 
+    simulatorRate = Signal(float)
+
+    simulatorCars = Signal(int)
+
+    bleConnect = Signal(str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.sourceType.emit("Bluetooth") # default source type
@@ -30,7 +39,7 @@ class Sidebar(QWidget):
         self.scourceLable = QLabel("Select Data Source:")
         layout.addWidget(self.scourceLable)
         self.scourceSelector = QComboBox()
-        self.scourceSelector.addItems(["Bluetooth", "File"])
+        self.scourceSelector.addItems(["Bluetooth", "File", "Simulator"])
         layout.addWidget(self.scourceSelector)
 
         #file selection UI
@@ -44,10 +53,29 @@ class Sidebar(QWidget):
 
         #BLE selection UI
         self.BLELabel = QLabel("BLE ID:")
-        self.BLESelector = QTextEdit("CAR_GOES_VROOM")
+        self.BLESelector = QTextEdit(DataGetter.DEVICE_ADDRESS)
         self.BLESelector.setFixedHeight(30)
+        #nothing is scanned for until this is pressed
+        self.BLEConnectButton = QPushButton("Connect")
+        self.BLEConnectButton.clicked.connect(lambda: self.bleConnect.emit(self.BLESelector.toPlainText().strip()))
         layout.addWidget(self.BLELabel)
         layout.addWidget(self.BLESelector)
+        layout.addWidget(self.BLEConnectButton)
+
+        #simulator UI, replays the selected file as if it came over BLE
+        self.simRateLabel = QLabel("Replay speed:")
+        self.simRateSelector = QComboBox()
+        self.simRateSelector.addItems([f"{rate}x" for rate in SIM_RATES])
+        self.simRateSelector.currentIndexChanged.connect(lambda i: self.simulatorRate.emit(SIM_RATES[i]))
+        #several simulated cars, for trying out multi car sessions without the hardware
+        self.simCarsLabel = QLabel("Cars:")
+        self.simCarsSelector = QSpinBox()
+        self.simCarsSelector.setRange(1, MAX_DEVICES)
+        self.simCarsSelector.valueChanged.connect(self.simulatorCars.emit)
+        layout.addWidget(self.simRateLabel)
+        layout.addWidget(self.simRateSelector)
+        layout.addWidget(self.simCarsLabel)
+        layout.addWidget(self.simCarsSelector)
 
         self.file_ble_UI_switch("Bluetooth")  # set initial state
         self.scourceSelector.currentTextChanged.connect(self.file_ble_UI_switch)
@@ -58,23 +86,38 @@ class Sidebar(QWidget):
         if source == "File":
             self.BLELabel.hide()
             self.BLESelector.hide()
+            self.BLEConnectButton.hide()
             self.file_label.show()
             self.select_file_button.show()
             self.fileSelectorLable.show()
+            self.simRateLabel.hide()
+            self.simRateSelector.hide()
+            self.simCarsLabel.hide()
+            self.simCarsSelector.hide()
             self.sourceType.emit("File")
         elif source == "Bluetooth":
             self.BLELabel.show()
             self.BLESelector.show()
+            self.BLEConnectButton.show()
             self.file_label.hide()
             self.select_file_button.hide()
             self.fileSelectorLable.hide()
+            self.simRateLabel.hide()
+            self.simRateSelector.hide()
+            self.simCarsLabel.hide()
+            self.simCarsSelector.hide()
             self.sourceType.emit("Bluetooth")
-        elif source == "Simulator (not implemented)":
+        elif source == "Simulator":
             self.BLELabel.hide()
             self.BLESelector.hide()
-            self.file_label.hide()
-            self.select_file_button.hide()
-            self.fileSelectorLable.hide()
+            self.BLEConnectButton.hide()
+            self.file_label.show()
+            self.select_file_button.show()
+            self.fileSelectorLable.show()
+            self.simRateLabel.show()
+            self.simRateSelector.show()
+            self.simCarsLabel.show()
+            self.simCarsSelector.show()
             self.sourceType.emit("Simulator")
 
     def open_file_dialog(self):
@@ -83,7 +126,7 @@ class Sidebar(QWidget):
             self,
             "Select a file",
             "",                           # starting directory ("" = current)
-            "CSV Files (*.csv)"  # file filters
+            "Run Files (*.csv *.daq)"  # file filters
         )
 
         if file_path:  # User selected a file
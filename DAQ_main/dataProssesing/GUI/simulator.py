@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+#run file helpers (runFile.py etc.) are shared with the analysis scripts one folder up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from runFile import load_run, run_columns
+from ble_getter import DataGetter
+from ingest_queue import IngestBus
+from frame_decoder import GPS_FIELDS, IMU_FIELDS, KIND_GPS, KIND_IMU, encode_frame, record_dtype, FRAME_HEADER
+
+#replay speeds offered in the GUI, log seconds per real second (the logs are 100 Hz, so 64x is 6400 samples/s)
+SIM_RATES = (1, 4, 16, 64)
+#how often the replay wakes up to send whatever samples are due (s)
+TICK_S = 0.002
+#largest notification payload (ATT MTU 512), caps the samples per framed notification
+MAX_PAYLOAD = 512
+
+def max_frame_samples(fields):
+    return (MAX_PAYLOAD - FRAME_HEADER.size) // record_dtype(fields).itemsize
+
+class SimulatedClient:
+    """
+    Stands in for BleakClient, so DataGetter(client=SimulatedClient(path))
+    streams a logged run as if the ESP32 were sending it: same characteristic
+    UUIDs, same little endian float32 payloads, a GPS then an IMU notification
+    per sample like DAQ_main.ino.
+
+    rate replays the log's own timing that many times faster, hz ignores it and
+    sends a fixed number of samples per second instead. frame_samples above 1
+    packs that many samples per notification in the framed layout (see
+    frame_decoder.py). With repeat set the run starts over when it ends, with
+    millis carrying on, so a load test can run as long as needed. start is how
+    far into the run (0-1) the replay begins, so several simulated cars on the
+    same run are not all in the same place.
+    """
+    def __init__(self, path, rate=1.0, hz=None, frame_samples=1, repeat=True, start=0.0):
+        self.path = path
+        self.start = start
+        self.rate = rate
+        self.hz = hz
+        self.frame_samples = frame_samples
+        self.repeat = repeat
+        self.millis = None
+        self.gps = None
+        self.imu = None
+        self.callbacks = {}
+        self.values = {}
+        self.task = None
+        #index of the next sample, counting every repeat of the run
+        self.first = 0
+        self.sent = 0
+        self.seq = {KIND_GPS: 0, KIND_IMU: 0}
+        self.is_connected = False
+
+    def _load(self):
+        columns = run_columns(self.path)
+        missing = [name for name in (*GPS_FIELDS, "millis") if name not in columns]
+        if missing:
+            raise ValueError(f"{self.path} has no {', '.join(missing)} column")
+        df = load_run(self.path, [*IMU_FIELDS, *GPS_FIELDS, "millis"])
+        self.millis = df["millis"].to_numpy().astype(np.int64)
+        self.gps = df[list(GPS_FIELDS)].to_numpy(dtype="<f4")
+        #channels an older log does not have are sent as 0, the same as the firmware does for yaw / roll / pitch
+        self.imu = np.zeros((len(df), len(IMU_FIELDS)), dtype="<f4")
+        for i, name in enumerate(IMU_FIELDS):
+            if name in df:
+                self.imu[:, i] = df[name].to_numpy(dtype="<f4")
+
+    async def connect(self):
+        await asyncio.to_thread(self._load)
+        if len(self.millis) == 0:
+            raise ValueError(f"{self.path} has no samples")
+        self.first = int(self.start * len(self.millis)) % len(self.millis)
+        self.sent = self.first
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        self.is_connected = False
+        self.callbacks.clear()
+        await self._stop()
+
+    async def read_gatt_char(self, uuid):
+        # the last payload sent, or the single zero byte the characteristics start out with
+        return self.values.get(uuid, bytearray(1))
+
+    async def start_notify(self, uuid, callback):
+        self.callbacks[uuid] = callback
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._replay())
+
+    async def stop_notify(self, uuid):
+        self.callbacks.pop(uuid, None)
+        if not self.callbacks:
+            await self._stop()
+
+    async def _stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def _due(self, elapsed):
+        # samples that should have been sent elapsed seconds into the replay, counting repeats
+        n = len(self.millis)
+        if self.hz is not None:
+            due = self.first + int(elapsed * self.hz)
+        else:
+            duration = self.millis[-1] - self.millis[0] + 1
+            laps, into = divmod(elapsed * 1000 * self.rate + self.millis[self.first] - self.millis[0], duration)
+            due = int(laps) * n + int(np.searchsorted(self.millis - self.millis[0], into, side="right"))
+        return due if self.repeat else min(due, n)
+
+    def _sample_millis(self, start, end):
+        n = len(self.millis)
+        if self.hz is not None:
+            return self.millis[0] + (np.arange(start, end) * 1000 // self.hz).astype(np.int64)
+        index = np.arange(start, end)
+        laps = index // n
+        return self.millis[index % n] + laps * (self.millis[-1] - self.millis[0] + 1)
+
+    async def _replay(self):
+        started = time.monotonic()
+        while True:
+            due = self._due(time.monotonic() - started)
+            if due > self.sent:
+                self._send(self.sent, due)
+                self.sent = due
+            elif not self.repeat and self.sent >= len(self.millis):
+                return
+            await asyncio.sleep(TICK_S)
+
+    def _send(self, start, end):
+        rows = np.arange(start, end) % len(self.millis)
+        millis = self._sample_millis(start, end)
+        streams = (
+            (DataGetter.GPS_STATUS_CHARACTERISTIC_UUID, KIND_GPS, GPS_FIELDS, self.gps[rows]),
+            (DataGetter.IMU_CHARACTERISTIC_UUID, KIND_IMU, IMU_FIELDS, self.imu[rows]),
+        )
+        payloads = []
+        for uuid, kind, fields, values in streams:
+            if self.frame_samples <= 1:
+                #one sample per notification, exactly what the firmware sends
+                data = values.tobytes()
+                size = values.shape[1] * 4
+                payloads.append((uuid, [data[i:i + size] for i in range(0, len(data), size)]))
+            else:
+                step = min(self.frame_samples, max_frame_samples(fields))
+                frames = []
+                for i in range(0, len(values), step):
+                    frames.append(encode_frame(kind, self.seq[kind], millis[i:i + step], values[i:i + step]))
+                    self.seq[kind] += 1
+                payloads.append((uuid, frames))
+
+        #interleaved gps / imu like the firmware's loop
+        for notifications in zip(*(p for _, p in payloads)):
+            for (uuid, _), data in zip(payloads, notifications):
+                self.values[uuid] = data
+                callback = self.callbacks.get(uuid)
+                if callback is not None:
+                    callback(uuid, bytearray(data))
+
+async def benchmark(path, seconds=10.0, rate=1.0, hz=None, frame_samples=1, cars=1):
+    """
+    Streams a run from cars simulated loggers at once through the same
+    BluetoothSource and ingest bus the GUI uses for a while and prints what
+    got through, no Bluetooth hardware or GUI needed.
+    """
+    #data_source builds on this module, so it is only imported once both are loaded
+    from data_source import BluetoothSource
+
+    clients = [SimulatedClient(path, rate, hz, frame_samples, start=i / cars) for i in range(cars)]
+    source = BluetoothSource("sim car", clients=clients)
+    await source.open()
+    bus = IngestBus()
+    queue = bus.subscribe("benchmark")
+    samples = {}
+
+    async def consume():
+        async for batch in queue:
+            samples[batch.device, batch.kind] = samples.get((batch.device, batch.kind), 0) + len(batch.time)
+
+    async def produce():
+        async for batch in source.batches():
+            bus.publish(batch)
+        bus.close()
+
+    consumer = asyncio.ensure_future(consume())
+    producer = asyncio.ensure_future(produce())
+    started = time.monotonic()
+    cpu = time.process_time()
+    await asyncio.sleep(seconds)
+    await source.close()
+    await producer
+    await consumer
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu
+
+    sent = sum(client.sent - client.first for client in clients)
+    print(f"{cars} car(s), {sent} samples sent in {elapsed:.1f} s ({sent / elapsed:.0f} Hz), "
+          f"cpu {cpu / elapsed:.0%} ({cpu / elapsed / cars:.1%} per car)")
+    for device, stats in source.stats().items():
+        for name, s in stats.items():
+            print(f"{device} {name}: {samples.get((device, name), 0)} samples received at {s['rate_hz']:.0f} Hz, "
+                  f"max gap {s['max_gap_ms']:.1f} ms, {s['lost']} frames lost, {s['bad']} bad payloads")
+    print(f"ingest: {queue.stats()}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a logged run through simulated loggers and report the throughput")
+    parser.add_argument("run", help="run file to replay (output_N.csv or .daq)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="how long to stream for (default: 10)")
+    parser.add_argument("--rate", type=float, default=1.0, help="replay speed, log seconds per real second (default: 1)")
+    parser.add_argument("--hz", type=float, default=None, help="send at this many samples/s instead of the logged timing")
+    parser.add_argument("--frame-samples", type=int, default=1, help="samples per notification (default: 1, like the firmware)")
+    parser.add_argument("--cars", type=int, default=1, help="simulated loggers streaming at once (default: 1)")
+    args = parser.parse_args(argv)
+    asyncio.run(benchmark(args.run, args.seconds, rate=args.rate, hz=args.hz,
+                          frame_samples=args.frame_samples, cars=args.cars))
+
+if __name__ == "__main__":
+    main()
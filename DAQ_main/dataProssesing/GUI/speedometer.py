@@ -1,8 +1,13 @@
 from PySide6.QtWidgets import QWidget
 from PySide6.QtGui import QPainter, QPen, QColor
 from PySide6.QtCore import Qt, QRectF, QPointF
+from collections import deque
 import math
 
+#what the max speed arc shows: the max over the last MAX_WINDOW_MS, since the start, or since the last new_lap()
+MAX_MODES = ("window", "session", "lap")
+MAX_WINDOW_MS = 10000
+
 class SpeedometerWidget(QWidget):
     def __init__(self, GPS, main_window):
         super().__init__()
@@ -11,20 +16,61 @@ class SpeedometerWidget(QWidget):
         self.GPS = GPS
         self.GPS.output_speed.connect(self.set_speed)
         self.max_speed = self.speed
-        self.speed_log = []
+        self.max_mode = "window"
+        self.max_window_ms = MAX_WINDOW_MS
+        #(time, speed) with speeds strictly decreasing front to back, the front is the window max
+        #a new speed knocks out every smaller one before it, they can never be the max again
+        self.speed_window = deque()
+        self.session_max = 0
+        self.lap_max = 0
 
         self.main_window = main_window
+        self.frame_clock = main_window.frame_clock
 
 
-    def set_speed(self, value):
+    def set_speed(self, value, time=None):
         self.speed = max(0, min(value, self.speed_lim))  # clamp
-        self.speed_log.append(self.speed)
+        if time is None:
+            time = self.GPS.get_time()  # log time of the point being played
+        if self.speed_window and time < self.speed_window[-1][0]:
+            # playback jumped back, the maxes so far are from later on
+            self.reset_max()
+
+        while self.speed_window and self.speed_window[-1][1] <= self.speed:
+            self.speed_window.pop()
+        self.speed_window.append((time, self.speed))
+        while self.speed_window[0][0] < time - self.max_window_ms:
+            self.speed_window.popleft()
+
+        self.session_max = max(self.session_max, self.speed)
+        self.lap_max = max(self.lap_max, self.speed)
+        self.update_max()
+        self.frame_clock.mark_dirty(self)
+
+    def update_max(self):
+        if self.max_mode == "session":
+            self.max_speed = self.session_max
+        elif self.max_mode == "lap":
+            self.max_speed = self.lap_max
+        else:
+            self.max_speed = self.speed_window[0][1] if self.speed_window else 0
+
+    def set_max_mode(self, mode):
+        if mode not in MAX_MODES:
+            raise ValueError(f"unknown max speed mode '{mode}'")
+        self.max_mode = mode
+        self.update_max()
+        self.frame_clock.mark_dirty(self)
 
-        if len(self.speed_log) > 20:  # keep last 100 speeds
-            self.speed_log.pop(0)
+    def new_lap(self):
+        self.lap_max = 0
+        self.update_max()
+        self.frame_clock.mark_dirty(self)
 
-        self.max_speed = max(self.speed_log)
-        self.update()
+    def reset_max(self):
+        self.speed_window.clear()
+        self.session_max = 0
+        self.lap_max = 0
 
     def paintEvent(self, event):
         painter = QPainter(self)
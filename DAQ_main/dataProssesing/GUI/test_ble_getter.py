@@ -0,0 +1,81 @@
+import asyncio
+
+import numpy as np
+
+from ble_getter import DataGetter
+from frame_decoder import GPS_STRUCT, IMU_STRUCT, KIND_IMU, encode_frame
+
+class FakeClient:
+    """
+    In-process stand-in for BleakClient, notify() calls the subscribed callback
+    the way bleak does.
+    """
+    def __init__(self):
+        self.callbacks = {}
+        self.is_connected = False
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def start_notify(self, uuid, callback):
+        self.callbacks[uuid] = callback
+
+    async def stop_notify(self, uuid):
+        self.callbacks.pop(uuid, None)
+
+    def notify(self, uuid, data):
+        self.callbacks[uuid](uuid, bytearray(data))
+
+def test_stream_decodes_notifications_into_batches():
+    async def run():
+        client = FakeClient()
+        getter = DataGetter(client, label="car 1")
+        assert await getter.connect()
+        stream = getter.stream()
+        #the first batch starts the notifications, so it is only sent once they are subscribed
+        first = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+
+        #one sample per notification like the firmware sends, then a framed one with two samples
+        client.notify(DataGetter.GPS_STATUS_CHARACTERISTIC_UUID, GPS_STRUCT.pack(45.5, -80.25))
+        client.notify(DataGetter.IMU_CHARACTERISTIC_UUID, IMU_STRUCT.pack(*range(12)))
+        client.notify(DataGetter.IMU_CHARACTERISTIC_UUID,
+                      encode_frame(KIND_IMU, 0, [1000, 1010], np.arange(24).reshape(2, 12) + 100))
+
+        batches = [await first, await stream.__anext__()]
+        await getter.disconnect()
+        return getter, batches
+
+    getter, (gps, imu) = asyncio.run(run())
+
+    assert gps.kind == "gps" and gps.device == "car 1"
+    np.testing.assert_array_equal(gps.values, np.array([[45.5, -80.25]], dtype=np.float32))
+    assert imu.kind == "imu" and imu.device == "car 1"
+    assert imu.values.shape == (3, 12)
+    np.testing.assert_array_equal(imu.values[0], np.arange(12))
+    np.testing.assert_array_equal(imu.values[1:], np.arange(24).reshape(2, 12) + 100)
+    #framed samples carry the device's millis
+    np.testing.assert_array_equal(imu.time[1:], [1000, 1010])
+    stats = getter.stats()
+    assert stats["imu"]["samples"] == 3 and stats["imu"]["bad"] == 0
+
+def test_stream_ends_when_the_device_disconnects():
+    async def run():
+        client = FakeClient()
+        getter = DataGetter(client, label="car 1")
+        await getter.connect()
+        stream = asyncio.ensure_future(_collect(getter.stream()))
+        await asyncio.sleep(0)
+        client.notify(DataGetter.IMU_CHARACTERISTIC_UUID, IMU_STRUCT.pack(*range(12)))
+        #what bleak's disconnected_callback does when the car drops out of range
+        getter.on_disconnected(client)
+        return await asyncio.wait_for(stream, 1.0)
+
+    batches = asyncio.run(run())
+    assert [batch.kind for batch in batches] == ["imu"]
+
+async def _collect(stream):
+    return [batch async for batch in stream]
@@ -0,0 +1,77 @@
+import math
+from collections import OrderedDict
+from PySide6.QtGui import QPainter, QPixmap
+from PySide6.QtCore import QPoint
+
+#size of a tile in logical pixels
+TILE_SIZE = 256
+#zoom levels whose tiles are kept around
+MAX_ZOOM_LEVELS = 4
+#tiles kept per zoom level, as a multiple of how many fit on screen
+TILES_PER_SCREEN = 3
+
+class TileCache:
+    """
+    Raster cache of an endless background (the map grid) cut into square tiles.
+    Tiles are placed in canvas coordinates (screen position minus the pan offset)
+    so panning only moves them and renders the tiles that newly come into view.
+    Each zoom gets its own set of tiles and the last few sets are kept, least
+    recently used first out, so zooming back and forth reuses them.
+
+    render_tile(painter, x, y, size, zoom) paints the size x size square of canvas
+    starting at (x, y) with the painter's origin at its top left corner.
+    """
+    def __init__(self, render_tile, tile_size=TILE_SIZE, max_levels=MAX_ZOOM_LEVELS):
+        self.render_tile = render_tile
+        self.tile_size = tile_size
+        self.max_levels = max_levels
+        self.levels = OrderedDict()
+
+    def clear(self):
+        self.levels.clear()
+
+    def level(self, zoom):
+        #wheel zooming multiplies and divides by the same factor, round off the float noise
+        key = round(zoom, 6)
+        tiles = self.levels.get(key)
+        if tiles is None:
+            tiles = self.levels[key] = OrderedDict()
+            while len(self.levels) > self.max_levels:
+                self.levels.popitem(last=False)
+        self.levels.move_to_end(key)
+        return tiles
+
+    def tile(self, tiles, i, j, zoom, ratio):
+        pixmap = tiles.get((i, j))
+        if pixmap is None or pixmap.devicePixelRatio() != ratio:
+            size = self.tile_size
+            pixmap = QPixmap(int(size * ratio), int(size * ratio))
+            pixmap.setDevicePixelRatio(ratio)
+            p = QPainter(pixmap)
+            self.render_tile(p, i * size, j * size, size, zoom)
+            p.end()
+            tiles[(i, j)] = pixmap
+        tiles.move_to_end((i, j))
+        return pixmap
+
+    def draw(self, p, zoom, offset_x, offset_y, width, height, ratio=1.0):
+        """
+        Draws the tiles covering a width x height screen panned by offset.
+        """
+        size = self.tile_size
+        tiles = self.level(zoom)
+        #whole pixel offset so neighbouring tiles line up without seams
+        ox = round(offset_x)
+        oy = round(offset_y)
+        first_i = math.floor(-ox / size)
+        last_i = math.floor((width - ox) / size)
+        first_j = math.floor(-oy / size)
+        last_j = math.floor((height - oy) / size)
+
+        for i in range(first_i, last_i + 1):
+            for j in range(first_j, last_j + 1):
+                p.drawPixmap(QPoint(i * size + ox, j * size + oy), self.tile(tiles, i, j, zoom, ratio))
+
+        limit = TILES_PER_SCREEN * (last_i - first_i + 1) * (last_j - first_j + 1)
+        while len(tiles) > limit:
+            tiles.popitem(last=False)
@@ -0,0 +1,165 @@
+import math
+import numpy as np
+from PySide6.QtCore import QLineF
+
+#how far (in screen pixels) a simplified track may stray from the real one
+PIXEL_TOLERANCE = 1.0
+#segments per block of the spatial index
+BLOCK_SIZE = 256
+#past this share of a level's segments on screen it is cheaper to draw the whole
+#level and let Qt clip than to pick out the visible segments
+DRAW_ALL_SHARE = 0.5
+
+def decimate(x, y, tolerance):
+    """
+    Indices of the points to keep so no dropped point is more than about
+    tolerance away from a kept one: the track is snapped to a grid of
+    tolerance sized cells and only the first point in each new cell is kept.
+    The first and last points are always kept.
+    """
+    if len(x) == 0:
+        return np.empty(0, dtype=np.int64)
+    cell_x = np.floor(x / tolerance)
+    cell_y = np.floor(y / tolerance)
+    keep = np.empty(len(x), dtype=bool)
+    keep[0] = True
+    keep[1:] = (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+    keep[-1] = True
+    return np.flatnonzero(keep)
+
+class TrackLevel:
+    """
+    One resolution of the track as a list of segments in the order they were
+    driven. A segment joining the same two grid cells as an earlier one (the
+    same bit of track on a later lap) is dropped, so the cost of drawing a
+    level depends on how much of the map the track covers, not how long it is.
+    Segments are grouped in blocks of BLOCK_SIZE with a bounding box each, so
+    only blocks in view get drawn.
+
+    Drawing is one drawLines call per color: every segment has a QLineF made
+    once, and the lines of each color are kept in driving order so the part
+    played so far is a slice of that list.
+    """
+    def __init__(self, x, y, colors, tolerance):
+        self.keep = decimate(x, y, tolerance)
+        self._lines = None
+        self._by_color = None
+
+        start = self.keep[:-1]
+        end = self.keep[1:]
+        if len(end):
+            cells = np.floor(np.stack([x[start], y[start], x[end], y[end]], axis=1) / tolerance)
+            #first segment of every distinct row, a stable lexsort instead of np.unique(axis=0)
+            #which holds the GIL for the whole sort and would stall the GUI while a loader thread builds this
+            order = np.lexsort(cells.T[::-1])
+            sorted_cells = cells[order]
+            new = np.ones(len(order), dtype=bool)
+            new[1:] = (sorted_cells[1:] != sorted_cells[:-1]).any(axis=1)
+            first = np.sort(order[new])
+            start = start[first]
+            end = end[first]
+
+        self.x0 = x[start]
+        self.y0 = y[start]
+        self.x1 = x[end]
+        self.y1 = y[end]
+        #index of the point each segment ends on, segments only show once playback gets there
+        self.end = end
+        self.colors = colors[end]
+
+        self.block_starts = np.arange(0, len(end), BLOCK_SIZE)
+        if len(end):
+            self.min_x = np.minimum.reduceat(np.minimum(self.x0, self.x1), self.block_starts)
+            self.max_x = np.maximum.reduceat(np.maximum(self.x0, self.x1), self.block_starts)
+            self.min_y = np.minimum.reduceat(np.minimum(self.y0, self.y1), self.block_starts)
+            self.max_y = np.maximum.reduceat(np.maximum(self.y0, self.y1), self.block_starts)
+
+    def visible_blocks(self, left, top, right, bottom):
+        if len(self.block_starts) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero((self.max_x >= left) & (self.min_x <= right) & (self.max_y >= top) & (self.min_y <= bottom))
+
+    @property
+    def lines(self):
+        # a QLineF per segment, only made for levels that actually get drawn
+        if self._lines is None:
+            self._lines = [QLineF(*segment) for segment in zip(self.x0.tolist(), self.y0.tolist(), self.x1.tolist(), self.y1.tolist())]
+        return self._lines
+
+    @property
+    def by_color(self):
+        # (color, end index of each segment, lines) per color, segments in driving order
+        if self._by_color is None:
+            lines = self.lines
+            order = np.argsort(self.colors, kind="stable")
+            groups = np.split(order, np.flatnonzero(np.diff(self.colors[order])) + 1) if len(order) else []
+            self._by_color = [(int(self.colors[group[0]]), self.end[group], [lines[j] for j in group]) for group in groups]
+        return self._by_color
+
+    def batches(self, segments, blocks):
+        """
+        (color, [QLineF]) for the first `segments` segments, limited to blocks.
+        """
+        if segments == 0 or len(blocks) == 0:
+            return []
+        starts = self.block_starts[blocks]
+        ends = np.minimum(starts + BLOCK_SIZE, segments)
+        if np.sum(ends - starts) >= DRAW_ALL_SHARE * len(self.end):
+            # most of it is on screen, slice the prebuilt per color lists
+            last = self.end[segments - 1]
+            batches = []
+            for color, end, lines in self.by_color:
+                n = int(np.searchsorted(end, last, side="right"))
+                if n:
+                    batches.append((color, lines[:n]))
+            return batches
+
+        index = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        colors = self.colors[index]
+        order = np.argsort(colors, kind="stable")
+        lines = self.lines
+        return [(int(colors[group[0]]), [lines[j] for j in index[group]])
+                for group in np.split(order, np.flatnonzero(np.diff(colors[order])) + 1)]
+
+class TrackLOD:
+    """
+    The track at several resolutions, built once per load. Level k keeps
+    enough points to be accurate to PIXEL_TOLERANCE at zoom_max / 2**k.
+    """
+    def __init__(self, x, y, colors, zoom_min, zoom_max):
+        self.x = x
+        self.y = y
+        self.colors = colors
+        self.zoom_max = zoom_max
+        level_count = max(1, math.ceil(math.log2(zoom_max / zoom_min)) + 1)
+        self.levels = [
+            TrackLevel(x, y, colors, PIXEL_TOLERANCE / zoom_max * 2**k)
+            for k in range(level_count)
+        ]
+
+    def __len__(self):
+        return len(self.x)
+
+    def level_for_zoom(self, zoom):
+        k = int(math.floor(math.log2(self.zoom_max / zoom)))
+        return self.levels[max(0, min(k, len(self.levels) - 1))]
+
+    def draw_list(self, zoom, view, index):
+        """
+        (color, [QLineF]) batches to draw for the track played up to point index,
+        seen through view = (left, top, right, bottom) in track coordinates.
+        The last bit from the last kept point to index comes back as its own batch.
+        """
+        level = self.level_for_zoom(zoom)
+        # segments that end at or before index
+        segments = int(np.searchsorted(level.end, index, side="right"))
+        kept = int(np.searchsorted(level.keep, index, side="right"))
+
+        blocks = level.visible_blocks(*view)
+        draw = level.batches(segments, blocks[level.block_starts[blocks] < segments])
+
+        last = level.keep[kept - 1] if kept else None
+        if last is not None and last < index:
+            tail = QLineF(self.x[last], self.y[last], self.x[index], self.y[index])
+            draw.append((int(self.colors[index]), [tail]))
+        return draw
@@ -28,77 +28,224 @@
 #m_cal
 #millis
 
+import argparse
+import glob
+import os
+import re
+import time
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from runFile import RUN_EXTENSION, load_run
+from runCache import DEFAULT_CACHE_DIR, RunCache
+from projection import LocalProjection, path_length
 
 xa_DC_offset = 0.0024662959390967104
 ya_DC_offset = 0.03943529025506331
 za_dc_offset = 0.24582377444442166
 
-def process_acceleration_data(file_path):
+#longitudinal acceleration (m/s^2) that starts / ends a braking or acceleration event
+#an event only ends once it falls back under EVENT_EXIT so noise around the threshold counts once
+EVENT_ENTER = 2.0
+EVENT_EXIT = 1.0
+#under this speed (m/s) the direction of travel is too noisy to split acceleration into braking / accelerating
+MIN_EVENT_SPEED = 1.0
+G = 9.80665
+#bump this whenever RunAnalyzer's math changes so cached summaries get recomputed
+ANALYSIS_VERSION = 3
 
-    # Load the CSV file
-    df = pd.read_csv(file_path)
+def current_dc_offsets():
+    # read when called, so a caller that changed the module's offsets gets the new ones
+    return (xa_DC_offset, ya_DC_offset, za_dc_offset)
 
-    # Ensure required columns are present
-    required_columns = ['millis', 'ax_b', 'ay_b', 'az_b']
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Column '{col}' not found in {file_path}")
+def analysis_params(dc_offsets=None, event_enter=EVENT_ENTER, event_exit=EVENT_EXIT):
+    """
+    Everything besides the run file itself that changes RunAnalyzer's results.
+    Used as part of the cache key, so the DC offsets are read when this is called.
+    """
+    if dc_offsets is None:
+        dc_offsets = current_dc_offsets()
+    return {
+        'version': ANALYSIS_VERSION,
+        'dc_offsets': [float(offset) for offset in dc_offsets],
+        'event_enter': event_enter,
+        'event_exit': event_exit,
+        'min_event_speed': MIN_EVENT_SPEED,
+    }
 
-    #apply DC offsets
-    df['ax_b'] = df['ax_b'] - xa_DC_offset
-    df['ay_b'] = df['ay_b'] - ya_DC_offset
-    df['az_b'] = df['az_b'] - za_dc_offset
+class RunAnalyzer:
+    """
+    Loads a run once and works out every stat listed at the top of this file from it.
+    Stats are computed from numpy columns the first time they are asked for, each
+    group only needs its own columns and raises ValueError if they are missing.
+    """
+    columns = ['millis', 'ax_b', 'ay_b', 'az_b', 'ax_w', 'ay_w', 'vx_fused', 'vy_fused', 'lat', 'lon']
 
-    # Calculate resultant acceleration
-    df['a_res'] = np.sqrt(df['ax_b']**2 + df['ay_b']**2 + df['az_b']**2)
+    def __init__(self, file_path, dc_offsets=None, event_enter=EVENT_ENTER, event_exit=EVENT_EXIT):
+        self.file_path = file_path
+        self.dc_offsets = dc_offsets if dc_offsets is not None else current_dc_offsets()
+        self.event_enter = event_enter
+        self.event_exit = event_exit
 
-    # Calculate max, average acceleration
-    max_acceleration = df['a_res'].max()
-    avg_acceleration = df['a_res'].mean()
+        # Load the run (binary run file if there is one), only the columns used here
+        self.df = load_run(file_path, self.columns)
+        self._require('millis')
+        self.time = self.df['millis'].to_numpy(dtype=float) / 1000.0  # ms to s
 
-    # Calculate total time in seconds
-    total_time = (df['millis'].iloc[-1] - df['millis'].iloc[0]) / 1000.0  # assuming time is in ms
+    def _require(self, *columns):
+        for col in columns:
+            if col not in self.df.columns:
+                raise ValueError(f"Column '{col}' not found in {self.file_path}")
 
-    return {
-        'max_acceleration': max_acceleration,
-        'avg_acceleration': avg_acceleration,
-        'total_time': total_time
-    }
+    def _column(self, name):
+        self._require(name)
+        return self.df[name].to_numpy(dtype=float)
 
+    @cached_property
+    def a_res(self):
+        # resultant acceleration with the DC offsets removed
+        ax = self._column('ax_b') - self.dc_offsets[0]
+        ay = self._column('ay_b') - self.dc_offsets[1]
+        az = self._column('az_b') - self.dc_offsets[2]
+        return np.sqrt(ax**2 + ay**2 + az**2)
 
-def prosses_velocity_data(file_path):
+    @cached_property
+    def v_res(self):
+        return np.hypot(self._column('vx_fused'), self._column('vy_fused'))
 
-    # Load the CSV file
-    df = pd.read_csv(file_path)
+    @cached_property
+    def a_long(self):
+        # world frame acceleration along the direction of travel, + speeding up, - braking
+        vx = self._column('vx_fused')
+        vy = self._column('vy_fused')
+        moving = self.v_res > MIN_EVENT_SPEED
+        a_long = np.zeros(len(vx))
+        a_long[moving] = (self._column('ax_w')[moving] * vx[moving] + self._column('ay_w')[moving] * vy[moving]) / self.v_res[moving]
+        return a_long
 
-    # Ensure required columns are present
-    required_columns = ['millis', 'vx_fused', 'vy_fused']
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Column '{col}' not found in {file_path}")
+    def total_time(self):
+        if len(self.time) == 0:
+            return 0.0
+        return self.time[-1] - self.time[0]
+
+    def acceleration_stats(self):
+        max_acceleration = nan_max(self.a_res)
+        avg_acceleration = nan_mean(self.a_res)
+        return {
+            'max_acceleration': max_acceleration,
+            'avg_acceleration': avg_acceleration,
+            'max_g': max_acceleration / G,
+            'avg_g': avg_acceleration / G,
+            'total_time': self.total_time(),
+        }
+
+    def velocity_stats(self):
+        return {
+            'max_velocity': nan_max(self.v_res),
+            'avg_velocity': nan_mean(self.v_res),
+        }
+
+    def distance_stats(self):
+        # trapezoid integration of the fused speed, rows with a blank speed or time are left out
+        known = np.isfinite(self.v_res) & np.isfinite(self.time)
+        v_res = self.v_res[known]
+        fused = np.sum(0.5 * (v_res[1:] + v_res[:-1]) * np.diff(self.time[known]))
+
+        # straight line distance between GPS fixes, skipping rows from before the GPS has a fix
+        lat = self._column('lat')
+        lon = self._column('lon')
+        fix = (lat != 0) & (lon != 0) & np.isfinite(lat) & np.isfinite(lon)
+        lat = lat[fix]
+        lon = lon[fix]
+        gps = 0.0
+        projection = LocalProjection.from_fixes(lat, lon)
+        if projection is not None:
+            gps = path_length(*projection.to_xy(lat, lon))
+
+        return {
+            'total_distance': fused,
+            'gps_distance': gps,
+        }
+
+    def event_stats(self):
+        return {
+            'braking_events': count_events(-self.a_long, self.event_enter, self.event_exit),
+            'acceleration_events': count_events(self.a_long, self.event_enter, self.event_exit),
+        }
+
+    def summary(self):
+        """
+        Every stat for the run in one dict.
+        """
+        return {
+            **self.velocity_stats(),
+            **self.distance_stats(),
+            **self.acceleration_stats(),
+            **self.event_stats(),
+        }
+
+    def params(self):
+        return analysis_params(self.dc_offsets, self.event_enter, self.event_exit)
 
-    # Calculate resultant velocity
-    df['v_res'] = np.sqrt(df['vx_fused']**2 + df['vy_fused']**2)
+    def channels(self):
+        """
+        The per sample channels the summary was worked out from.
+        """
+        return {
+            'time': self.time,
+            'a_res': self.a_res,
+            'v_res': self.v_res,
+            'a_long': self.a_long,
+        }
 
+def nan_max(values):
+    # blank cells load as nan, these skip them like the pandas max / mean the stats used to come from
+    finite = values[np.isfinite(values)]
+    return finite.max() if len(finite) else np.nan
 
-    # Calculate max, average velocity
-    max_velocity = df['v_res'].max()
-    avg_velocity = df['v_res'].mean()
+def nan_mean(values):
+    finite = values[np.isfinite(values)]
+    return finite.mean() if len(finite) else np.nan
 
+def count_events(signal, enter, exit):
+    """
+    Counts how many times signal rises above enter. After an event starts it
+    has to drop below exit before another one can be counted.
+    """
+    if len(signal) == 0:
+        return 0
+    # 1 above enter, 0 below exit, nan in between
+    state = np.full(len(signal), np.nan)
+    state[signal < exit] = 0
+    state[signal > enter] = 1
+
+    # samples between the thresholds keep the last state that was set
+    last_set = np.where(np.isnan(state), 0, np.arange(len(state)))
+    np.maximum.accumulate(last_set, out=last_set)
+    active = np.nan_to_num(state[last_set]) == 1
+
+    return int(active[0]) + int(np.count_nonzero(active[1:] & ~active[:-1]))
+
+def process_acceleration_data(file_path):
+    stats = RunAnalyzer(file_path).acceleration_stats()
     return {
-        'max_velocity': max_velocity,
-        'avg_velocity': avg_velocity,
+        'max_acceleration': stats['max_acceleration'],
+        'avg_acceleration': stats['avg_acceleration'],
+        'total_time': stats['total_time']
     }
 
+
+def prosses_velocity_data(file_path):
+    return RunAnalyzer(file_path).velocity_stats()
+
 def calc_DC_offsets(file_path):
 
-    # Load the CSV file
-    df = pd.read_csv(file_path)
+    # Load the run (binary run file if there is one), only the needed columns
+    required_columns = ['ax_b', 'ay_b', 'az_b']
+    df = load_run(file_path, required_columns)
 
     # Ensure required columns are present
-    required_columns = ['ax_b', 'ay_b', 'az_b']
     for col in required_columns:
         if col not in df.columns:
             raise ValueError(f"Column '{col}' not found in {file_path}")
@@ -111,4 +258,122 @@ def calc_DC_offsets(file_path):
     }
 
     return dc_offsets
-print(process_acceleration_data("output_1.csv"))
\ No newline at end of file
+
+def analysis_settings(dc_offsets=None):
+    # (dc offsets, event enter, event exit) as they are now, what analyze_run and analysis_params take
+    return (dc_offsets if dc_offsets is not None else current_dc_offsets()), EVENT_ENTER, EVENT_EXIT
+
+def analyze_run(file_path, dc_offsets, event_enter, event_exit, channels=False):
+    # runs in a worker process, so it has to be a top level function. The settings are passed in
+    # rather than read from this module, a spawned worker would see its own copy of the offsets.
+    # the per sample channels are only sent back when asked for (to be cached), they are the bulk of the pickling
+    analyzer = RunAnalyzer(file_path, dc_offsets, event_enter, event_exit)
+    return {'rows': len(analyzer.time), **analyzer.summary()}, analyzer.channels() if channels else None
+
+def summarize_run(file_path, cache=None, dc_offsets=None):
+    """
+    Summary of one run. With a RunCache it is only worked out again if the file
+    or the analysis settings (DC offsets, thresholds, code version) changed.
+    Flush the cache after a batch of these, hits are not written to disk on their own.
+    """
+    settings = analysis_settings(dc_offsets)
+    if cache is None:
+        return analyze_run(file_path, *settings)[0]
+    key = cache.key(file_path, analysis_params(*settings))
+    hit = cache.get(key)
+    if hit is not None:
+        return hit[0]
+    summary, channels = analyze_run(file_path, *settings, channels=True)
+    cache.put(key, summary, channels)
+    return summary
+
+def find_runs(target):
+    """
+    Run files in a directory (output_N.csv / output_N.daq) or matching a glob, in run number order.
+    A run that has both a csv and a binary file is only listed once. The splitter's
+    output_partial file (left behind if a split was interrupted) is not a run.
+    """
+    if os.path.isdir(target):
+        paths = [path for extension in (".csv", RUN_EXTENSION)
+                 for path in glob.glob(os.path.join(target, "output_*" + extension))
+                 if re.fullmatch(r"output_\d+", os.path.splitext(os.path.basename(path))[0])]
+    else:
+        paths = glob.glob(target)
+
+    runs = {}
+    for path in paths:
+        runs.setdefault(os.path.splitext(path)[0], path)
+
+    def run_number(path):
+        numbers = re.findall(r"\d+", os.path.basename(path))
+        return (int(numbers[-1]) if numbers else -1, path)
+    return sorted(runs.values(), key=run_number)
+
+def analyze_runs(paths, workers=None, cache=None, dc_offsets=None):
+    """
+    Summarizes every run on a process pool (one worker per core by default)
+    and returns one row per run. Runs found in the cache are not sent to the pool.
+    Runs that fail are reported and left out.
+    """
+    start = time.perf_counter()
+    #read once here, the same settings make the cache keys and go to the workers
+    settings = analysis_settings(dc_offsets)
+    params = analysis_params(*settings)
+    summaries = {}
+    keys = {}
+    misses = []
+    for path in paths:
+        if cache is not None:
+            keys[path] = cache.key(path, params)
+            hit = cache.get(keys[path])
+            if hit is not None:
+                summaries[path] = hit[0]
+                continue
+        misses.append(path)
+    cached = len(summaries)
+
+    if misses:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = [(path, pool.submit(analyze_run, path, *settings, cache is not None)) for path in misses]
+            for path, future in futures:
+                try:
+                    summaries[path], channels = future.result()
+                except (OSError, ValueError) as e:
+                    print(f"Skipping {path}: {e}")
+                    continue
+                if cache is not None:
+                    cache.put(keys[path], summaries[path], channels)
+    if cache is not None:
+        cache.flush()
+    elapsed = time.perf_counter() - start
+
+    table = pd.DataFrame([{'run': os.path.basename(path), **summaries[path]} for path in paths if path in summaries])
+    rows = int(table['rows'].sum()) if len(table) else 0
+    print(f"Analyzed {len(table)} runs ({rows} rows, {cached} from cache) in {elapsed:.2f} s: "
+          f"{len(table) / elapsed:.1f} runs/s, {rows / elapsed:.0f} rows/s")
+    return table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize every run in a folder")
+    parser.add_argument("runs", nargs="?", default="runs", help="folder of output_N files or a glob like 'runs/output_*.csv'")
+    parser.add_argument("-o", "--output", default="run_summary.csv", help="summary table, .csv or .xlsx")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="where run summaries are cached")
+    parser.add_argument("--no-cache", action="store_true", help="analyze every run again")
+    args = parser.parse_args(argv)
+
+    paths = find_runs(args.runs)
+    if not paths:
+        print(f"No runs found in {args.runs}")
+        return
+
+    cache = None if args.no_cache else RunCache(args.cache_dir)
+    table = analyze_runs(paths, args.workers, cache)
+    if args.output.endswith(".xlsx"):
+        table.to_excel(args.output, index=False)  # needs openpyxl
+    else:
+        table.to_csv(args.output, index=False)
+    print(f"Saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 import pandas as pd
+import numpy as np
+import hashlib
+import json
+import io
 import os
+from runFile import RunFileWriter, binary_path, write_run
 
 #cd to the folder where your data is stored
 #change name of the input file at the bottom of this script
@@ -35,7 +40,15 @@ dataLabels = [
     "millis"
 ]
 
-def split_csv_on_time_reset(input_file, output_dir="runs", time_col="time", labels=dataLabels):
+#runs shorter than this are dropped
+MIN_RUN_MS = 300000
+#streaming mode reads the log this many bytes at a time (rounded up to a full line)
+BLOCK_BYTES = 8 * 1024 * 1024
+#streaming mode keeps this file in the output folder to only split what was appended since last time
+MANIFEST_NAME = "split_manifest.json"
+MANIFEST_VERSION = 1
+
+def split_csv_on_time_reset(input_file, output_dir="runs", time_col="time", labels=dataLabels, binary=True):
 
     # Create output directory if it doesn’t exist
     os.makedirs(output_dir, exist_ok=True)
@@ -50,11 +63,8 @@ def split_csv_on_time_reset(input_file, output_dir="runs", time_col="time", labe
     df[time_col] = df[time_col].astype(int)
 
     # Identify where time resets (previous > current)
-    reset_points = [0]
-    for i in range(1, len(df)):
-        if df[time_col].iloc[i] < df[time_col].iloc[i - 1]:
-            reset_points.append(i)
-    reset_points.append(len(df))  # include last segment end
+    times = df[time_col].to_numpy()
+    reset_points = [0, *(np.flatnonzero(times[1:] < times[:-1]) + 1), len(df)]
 
     # Split into segments
     segment_count = 0
@@ -65,8 +75,8 @@ def split_csv_on_time_reset(input_file, output_dir="runs", time_col="time", labe
         # Calculate duration in ms
         duration_ms = segment[time_col].iloc[-1] - segment[time_col].iloc[0]
 
-        # Skip segments shorter than (200000 ms)
-        if duration_ms < 300000:
+        # Skip segments shorter than MIN_RUN_MS
+        if duration_ms < MIN_RUN_MS:
             continue
 
         if labels:
@@ -75,11 +85,286 @@ def split_csv_on_time_reset(input_file, output_dir="runs", time_col="time", labe
         segment_count += 1
         output_path = os.path.join(output_dir, f"output_{segment_count}.csv")
         segment.to_csv(output_path, index=False)
+        if binary:
+            write_run(binary_path(output_path), segment)
         print(f"Saved: {output_path} ({duration_ms / 1000:.2f} s)")
 
     if segment_count == 0:
         print("No segments longer than 1 minute found.")
 
+def split_csv_streaming(input_file, output_dir="runs", time_col="time", labels=dataLabels, block_bytes=BLOCK_BYTES,
+                        incremental=True, binary=True):
+    """
+    Same split as split_csv_on_time_reset but without loading the whole log.
+    The log is read in blocks of about block_bytes, resets are found with
+    vectorized comparisons (carrying the last time across block boundaries)
+    and each run is copied to output_N.csv as it is read. With binary set a
+    columnar output_N.daq is written alongside it (see runFile.py).
+
+    With incremental set, a split manifest is kept in output_dir. When the log
+    has only been appended to since the last split, parsing restarts at the
+    last segment and earlier runs keep their files and numbers.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+
+    with open(input_file, "rb") as f:
+        header_line = f.readline()
+        columns = list(pd.read_csv(io.BytesIO(header_line), nrows=0).columns)
+        if time_col not in columns:
+            raise ValueError(f"'{time_col}' column not found in {input_file}")
+
+        header = columns
+        if labels:
+            if len(labels) == len(columns):
+                header = labels
+            else:
+                print(f"Label count ({len(labels)}) does not match column count ({len(columns)}). Skipping relabeling.")
+
+        settings = {
+            "version": MANIFEST_VERSION,
+            "header_sha256": hashlib.sha256(header_line).hexdigest(),
+            "time_col": time_col,
+            "labels": list(header),
+            "min_run_ms": MIN_RUN_MS,
+            "binary": binary,
+        }
+        size = os.fstat(f.fileno()).st_size
+
+        segments = []
+        resume_offset = len(header_line)
+        run_count = 0
+
+        manifest = _load_manifest(manifest_path) if incremental else None
+        if manifest is not None:
+            resume = _resume_point(f, manifest, settings, size)
+            if resume is None:
+                print(f"{input_file} does not match {manifest_path}, re-splitting from the start.")
+                _remove_runs(output_dir, manifest)
+            elif size == manifest["size"]:
+                print(f"Runs in {output_dir} are already up to date.")
+                return
+            else:
+                segments, resume_offset, run_count = resume
+
+        f.seek(resume_offset)
+        writer = _SegmentWriter(output_dir, header, run_count, binary)
+        prev_time = None
+        skipped = 0
+
+        for block_offset, block in _read_blocks(f, block_bytes):
+            # rows are copied out as raw bytes, so unless the binary file is wanted only the time column is parsed
+            block_df = pd.read_csv(io.BytesIO(block), header=None, names=columns, usecols=None if binary else [time_col],
+                                   skip_blank_lines=False)
+            times = block_df[time_col].to_numpy(dtype=float)
+            if binary:
+                block_df.columns = header
+
+            # byte range of every line in the block
+            line_ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n")) + 1
+            if len(line_ends) == 0 or line_ends[-1] != len(block):
+                line_ends = np.append(line_ends, len(block))
+            line_starts = np.concatenate(([0], line_ends[:-1]))
+            if len(line_starts) != len(times):
+                raise ValueError(f"Could not line up rows with lines in {input_file}")
+
+            # blank lines and rows torn by a power cut have no time, they are left out of the runs
+            kept = np.flatnonzero(np.isfinite(times))
+            if len(kept) != len(times):
+                skipped += len(times) - len(kept)
+                times, line_starts, line_ends = times[kept], line_starts[kept], line_ends[kept]
+                if binary:
+                    block_df = block_df.iloc[kept]
+            times = times.astype(np.int64)
+            if len(times) == 0:
+                writer.skip(block)
+                continue
+
+            # a reset can fall between the last row of the previous block and the first row of this one
+            if prev_time is not None and times[0] < prev_time:
+                writer.finish()
+
+            # rows are copied out in pieces of adjacent lines, cut at every reset and every left out line
+            resets = np.flatnonzero(times[1:] < times[:-1]) + 1
+            gaps = np.flatnonzero(line_starts[1:] != line_ends[:-1]) + 1
+            cuts = [0, *np.union1d(resets, gaps), len(times)]
+            resets = set(resets.tolist())
+            copied = 0
+            for i in range(len(cuts) - 1):
+                start, end = cuts[i], cuts[i + 1]
+                if start in resets:
+                    writer.finish()
+                writer.skip(block[copied:line_starts[start]])
+                writer.append(block[line_starts[start]:line_ends[end - 1]], block_offset + line_starts[start],
+                              end - start, times[start], times[end - 1], block_df.iloc[start:end] if binary else None)
+                copied = line_ends[end - 1]
+            writer.skip(block[copied:])
+
+            prev_time = times[-1]
+
+        writer.finish()
+
+    if skipped:
+        print(f"Skipped {skipped} lines without a '{time_col}' value in {input_file}.")
+    segments += writer.segments
+    if incremental:
+        _save_manifest(manifest_path, {**settings, "size": size, "run_count": writer.segment_count, "segments": segments})
+
+    if writer.segment_count == 0:
+        print("No segments longer than 1 minute found.")
+
+def _read_blocks(f, block_bytes):
+    # yields (byte offset, chunk of whole lines about block_bytes long)
+    while True:
+        offset = f.tell()
+        block = f.read(block_bytes)
+        if not block:
+            return
+        if not block.endswith(b"\n"):
+            block += f.readline()
+        yield offset, block
+
+def _load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+def _save_manifest(manifest_path, manifest):
+    # write to a temp file first so a crash never leaves a half written manifest
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def _resume_point(f, manifest, settings, size):
+    """
+    Checks that the log is the one the manifest was written for, only appended to.
+    Returns (settled segments, byte offset to resume at, runs already numbered)
+    or None if the log has to be split from the start.
+    """
+    if any(manifest.get(key) != value for key, value in settings.items()):
+        return None
+    if size < manifest["size"]:
+        return None
+
+    segments = manifest["segments"]
+    if not segments:
+        return [], f.tell(), 0
+
+    # the last segment may continue into the appended bytes, so it is always re-parsed
+    tail = segments[-1]
+    if _hash_range(f, tail["start"], tail["end"]) != tail["sha256"]:
+        return None
+
+    run_count = tail["run"] - 1 if tail["run"] else manifest["run_count"]
+    return segments[:-1], tail["start"], run_count
+
+def _hash_range(f, start, end):
+    digest = hashlib.sha256()
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = f.read(min(remaining, BLOCK_BYTES))
+        if not data:
+            break
+        digest.update(data)
+        remaining -= len(data)
+    return digest.hexdigest()
+
+def _remove_runs(output_dir, manifest):
+    for segment in manifest["segments"]:
+        if segment["run"]:
+            output_path = os.path.join(output_dir, f"output_{segment['run']}.csv")
+            for path in (output_path, binary_path(output_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+class _SegmentWriter:
+    """
+    Writes one segment at a time to a partial file and only keeps it
+    as output_N.csv (and output_N.daq) once it ends and is at least MIN_RUN_MS long.
+    Every segment seen (kept or not) is recorded in self.segments for the manifest.
+    """
+    def __init__(self, output_dir, header, segment_count=0, binary=False):
+        self.output_dir = output_dir
+        self.binary = binary
+        self.header = ",".join(header) + "\n"
+        self.partial_path = os.path.join(output_dir, "output_partial.csv")
+        self.segment_count = segment_count
+        self.segments = []
+        self.file = None
+        self.run_writer = None
+        self.digest = None
+        self.start = 0
+        self.end = 0
+        self.rows = 0
+        self.first_time = 0
+        self.last_time = 0
+
+    def append(self, rows, offset, row_count, first_time, last_time, frame=None):
+        if self.file is None:
+            self.file = open(self.partial_path, "wb")
+            self.file.write(self.header.encode())
+            if self.binary:
+                self.run_writer = RunFileWriter(binary_path(self.partial_path))
+            self.digest = hashlib.sha256()
+            self.start = offset
+            self.rows = 0
+            self.first_time = first_time
+        self.digest.update(rows)
+        self.end = offset + len(rows)
+        self.rows += row_count
+        self.last_time = last_time
+        if not rows.endswith(b"\n"):
+            rows += b"\n"
+        self.file.write(rows)
+        if self.run_writer is not None:
+            self.run_writer.append(frame)
+
+    def skip(self, data):
+        # lines left out inside a segment still count towards its byte range, so the manifest hash covers them
+        if self.file is None or not data:
+            return
+        self.digest.update(data)
+        self.end += len(data)
+
+    def finish(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+
+        segment = {
+            "start": int(self.start),
+            "end": int(self.end),
+            "rows": int(self.rows),
+            "first_time": int(self.first_time),
+            "last_time": int(self.last_time),
+            "sha256": self.digest.hexdigest(),
+            "run": None,
+        }
+        self.segments.append(segment)
+
+        run_writer = self.run_writer
+        self.run_writer = None
+
+        duration_ms = self.last_time - self.first_time
+        if duration_ms < MIN_RUN_MS:
+            os.remove(self.partial_path)
+            if run_writer is not None:
+                run_writer.discard()
+            return
+
+        self.segment_count += 1
+        segment["run"] = self.segment_count
+        output_path = os.path.join(self.output_dir, f"output_{self.segment_count}.csv")
+        os.replace(self.partial_path, output_path)
+        if run_writer is not None:
+            run_writer.close()
+            os.replace(binary_path(self.partial_path), binary_path(output_path))
+        print(f"Saved: {output_path} ({duration_ms / 1000:.2f} s)")
+
 def label_columns(df, labels):
     """
     Rename dataframe columns based on a provided list of labels.
@@ -92,4 +377,5 @@ def label_columns(df, labels):
     return df
 
 if __name__ == "__main__":
-    split_csv_on_time_reset(input_file="datalog.csv", output_dir="runs", time_col="time")
\ No newline at end of file
+    #use split_csv_on_time_reset instead to do the split in memory
+    split_csv_streaming(input_file="datalog.csv", output_dir="runs", time_col="time")
\ No newline at end of file
@@ -0,0 +1,43 @@
+import numpy as np
+
+#local flat projection of GPS fixes into meters (east, north) from an origin fix
+#the tracks this is used for are a few km across at most, so an equirectangular
+#projection about the origin is well under a meter off and vectorizes trivially
+
+EARTH_RADIUS = 6371000.0
+
+class LocalProjection:
+    """
+    Projects lat/lon (degrees) to x east / y north in meters from (lat0, lon0).
+    Works on scalars or whole numpy arrays.
+    """
+    def __init__(self, lat0, lon0):
+        self.lat0 = float(lat0)
+        self.lon0 = float(lon0)
+        self.meters_per_deg_lat = np.radians(1.0) * EARTH_RADIUS
+        self.meters_per_deg_lon = self.meters_per_deg_lat * np.cos(np.radians(self.lat0))
+
+    @classmethod
+    def from_fixes(cls, lat, lon):
+        # origin at the first fix, None if there are no fixes yet
+        if len(lat) == 0:
+            return None
+        return cls(lat[0], lon[0])
+
+    def to_xy(self, lat, lon):
+        x = (np.asarray(lon, dtype=float) - self.lon0) * self.meters_per_deg_lon
+        y = (np.asarray(lat, dtype=float) - self.lat0) * self.meters_per_deg_lat
+        return x, y
+
+    def to_latlon(self, x, y):
+        lat = np.asarray(y, dtype=float) / self.meters_per_deg_lat + self.lat0
+        lon = np.asarray(x, dtype=float) / self.meters_per_deg_lon + self.lon0
+        return lat, lon
+
+def path_length(x, y):
+    """
+    Length in meters of the polyline through the projected points.
+    """
+    if len(x) < 2:
+        return 0.0
+    return float(np.hypot(np.diff(x), np.diff(y)).sum())
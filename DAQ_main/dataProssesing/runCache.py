@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+#disk cache for run summaries so unchanged runs are not analyzed again
+#entries are keyed by the run file's content hash plus whatever settings the analysis used
+#(code version, DC offsets, thresholds), so changing any of those misses the cache
+#the file's size and mtime are kept next to its hash so unchanged files are not re-hashed
+#cache hits only touch the index in memory, it is written out by flush() / close() (and on every put)
+
+DEFAULT_CACHE_DIR = ".run_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+INDEX_NAME = "index.json"
+HASH_BLOCK_BYTES = 8 * 1024 * 1024
+
+class RunCache:
+    """
+    Holds a summary dict and a few numpy channels per entry in one .npz file.
+    Once the entries go over max_bytes the least recently used are removed.
+    Not safe to share between processes, use it from the parent process only.
+    Call flush() or close() (or use it in a with block) once done so the use times are saved.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_path = os.path.join(cache_dir, INDEX_NAME)
+        self.index = {"entries": {}, "files": {}}
+        self.dirty = False
+        self._key_files = {} #cache key -> hash of the run file it was made from
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError):
+                print(f"Could not read {self.index_path}, starting an empty cache.")
+
+    def file_hash(self, path):
+        # only re-hash the file if its size or mtime changed since last time
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        known = self.index["files"].get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while data := f.read(HASH_BLOCK_BYTES):
+                digest.update(data)
+        self.index["files"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+        self.dirty = True
+        return digest.hexdigest()
+
+    def key(self, path, params):
+        """
+        Cache key for a run file analyzed with params (a json-able dict).
+        """
+        file_hash = self.file_hash(path)
+        content = json.dumps({"file": file_hash, "params": params}, sort_keys=True)
+        key = hashlib.sha256(content.encode()).hexdigest()
+        self._key_files[key] = file_hash
+        return key
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def get(self, key):
+        """
+        Returns (summary, channels) or None on a miss.
+        """
+        entry = self.index["entries"].get(key)
+        if entry is None:
+            return None
+        try:
+            with np.load(self._entry_path(key)) as data:
+                summary = json.loads(str(data["summary"]))
+                channels = {name: data[name] for name in data.files if name != "summary"}
+        except (OSError, ValueError, KeyError):
+            self._remove(key)
+            self._save_index()
+            return None
+
+        entry["last_used"] = time.time()
+        entry["file"] = self._key_files.get(key, entry.get("file"))
+        self.dirty = True
+        return summary, channels
+
+    def put(self, key, summary, channels=None):
+        path = self._entry_path(key)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, summary=np.array(json.dumps(summary)), **(channels or {}))
+        os.replace(tmp_path, path)
+
+        self.index["entries"][key] = {"size": os.path.getsize(path), "last_used": time.time(),
+                                      "file": self._key_files.get(key)}
+        self._evict()
+        self._save_index()
+
+    def _evict(self):
+        entries = self.index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]["size"]
+            self._remove(key)
+
+    def _remove(self, key):
+        self.index["entries"].pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _prune_files(self):
+        # forget hashes of files that are gone or that no entry was made from (anymore)
+        used = {entry.get("file") for entry in self.index["entries"].values()}
+        files = self.index["files"]
+        stale = [path for path, known in files.items() if known["sha256"] not in used or not os.path.exists(path)]
+        for path in stale:
+            del files[path]
+        return bool(stale)
+
+    def flush(self):
+        if self._prune_files() or self.dirty:
+            self._save_index()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
@@ -0,0 +1,219 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+#columnar binary run files (output_N.daq) written next to the output_N.csv files
+#layout:
+#   8 byte magic
+#   uint32 header length, then a json header {"rows": n, "columns": [{"name", "dtype", "offset"}]}
+#   zero padding up to a 64 byte boundary
+#   one contiguous array per column, each starting on a 64 byte boundary (offsets are from the data start)
+#every column can be memory mapped and read on its own without copying
+
+RUN_EXTENSION = ".daq"
+MAGIC = b"DAQRUN\x00\x01"
+ALIGN = 64
+_HEADER_LEN = struct.Struct("<I")
+
+#channels that are stored as ints, everything else is a float64
+INT_CHANNELS = {
+    "millis": "<i8",
+    "sys_cal": "<u1",
+    "g_cal": "<u1",
+    "a_cal": "<u1",
+    "m_cal": "<u1",
+}
+
+def binary_path(csv_path):
+    return os.path.splitext(csv_path)[0] + RUN_EXTENSION
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def _column_dtype(name, values):
+    # fall back to float64 if an int channel has gaps or fractions in it
+    dtype = INT_CHANNELS.get(name)
+    if dtype is not None and _whole_numbers(values):
+        return np.dtype(dtype)
+    return np.dtype("<f8")
+
+def _whole_numbers(values):
+    # a chunk that had a blank row dropped from it still parses as float, it fits an int if nothing is lost
+    if np.issubdtype(values.dtype, np.integer):
+        return True
+    return np.issubdtype(values.dtype, np.floating) and bool(np.all(np.isfinite(values) & (values == np.rint(values))))
+
+def _write_file(path, rows, columns):
+    """
+    columns is a list of (name, dtype, source) where source is either a numpy
+    array or an open file holding the raw column bytes.
+    """
+    header_columns = []
+    offset = 0
+    for name, dtype, _ in columns:
+        header_columns.append({"name": name, "dtype": dtype.str, "offset": offset})
+        offset = _align(offset + rows * dtype.itemsize)
+    header = json.dumps({"rows": rows, "columns": header_columns}).encode()
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        data_start = _align(f.tell())
+        for column, (name, dtype, source) in zip(header_columns, columns):
+            f.write(b"\0" * (data_start + column["offset"] - f.tell()))
+            if isinstance(source, np.ndarray):
+                f.write(np.ascontiguousarray(source, dtype=dtype).tobytes())
+            else:
+                source.seek(0)
+                shutil.copyfileobj(source, f)
+
+def write_run(path, df):
+    """
+    Writes a whole dataframe as a run file.
+    """
+    columns = []
+    for name in df.columns:
+        values = df[name].to_numpy()
+        columns.append((str(name), _column_dtype(str(name), values), values))
+    _write_file(path, len(df), columns)
+
+class RunFileWriter:
+    """
+    Builds a run file a chunk at a time without holding the run in memory.
+    Each column is spilled to its own temp file and they are joined on close().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.names = None
+        self.dtypes = None
+        self.spills = None
+
+    def append(self, df):
+        if self.names is None:
+            self.names = [str(name) for name in df.columns]
+            self.dtypes = [_column_dtype(name, df[name].to_numpy()) for name in self.names]
+            self.spills = [tempfile.TemporaryFile() for _ in self.names]
+        for i, name in enumerate(self.names):
+            values = df[name].to_numpy()
+            if self.dtypes[i].kind in "iu" and not _whole_numbers(values):
+                # a later chunk has gaps in an int channel, nan can not be cast to an int so the column becomes float64
+                self._widen(i)
+            self.spills[i].write(values.astype(self.dtypes[i]).tobytes())
+        self.rows += len(df)
+
+    def _widen(self, i):
+        spill = self.spills[i]
+        spill.seek(0)
+        values = np.frombuffer(spill.read(), dtype=self.dtypes[i]).astype("<f8")
+        spill.seek(0)
+        spill.truncate()
+        spill.write(values.tobytes())
+        self.dtypes[i] = np.dtype("<f8")
+
+    def close(self):
+        if self.names is None:
+            return
+        _write_file(self.path, self.rows, list(zip(self.names, self.dtypes, self.spills)))
+        self.discard()
+
+    def discard(self):
+        for spill in self.spills or []:
+            spill.close()
+        self.names = None
+        self.spills = None
+
+class RunFile:
+    """
+    Memory mapped run file. run["millis"] returns a read only numpy view of
+    the column straight out of the map, nothing is parsed or copied.
+
+    Close it (or use it in a with block) once done, an open map keeps the file
+    locked on Windows so the splitter could not replace it. Views taken out of
+    it have to be dropped first, copy anything that is kept for longer.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a run file")
+        header_start = len(MAGIC) + _HEADER_LEN.size
+        (header_len,) = _HEADER_LEN.unpack_from(self._map, len(MAGIC))
+        header = json.loads(self._map[header_start:header_start + header_len])
+
+        self.rows = header["rows"]
+        self._data_start = _align(header_start + header_len)
+        self._columns = {c["name"]: c for c in header["columns"]}
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            raise KeyError(f"Column '{name}' not found in {self.path}")
+        column = self._columns[name]
+        return np.frombuffer(self._map, dtype=np.dtype(column["dtype"]), count=self.rows,
+                             offset=self._data_start + column["offset"])
+
+    def to_frame(self, columns=None, copy=False):
+        names = self.columns if columns is None else [c for c in columns if c in self._columns]
+        return pd.DataFrame({name: self[name] for name in names}, copy=copy)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_binary(path):
+    # use the .daq file if one was written for (and is not older than) a csv run
+    if path.endswith(RUN_EXTENSION):
+        return RunFile(path)
+    bin_path = binary_path(path)
+    if os.path.exists(bin_path) and os.path.getmtime(bin_path) >= os.path.getmtime(path):
+        return RunFile(bin_path)
+    return None
+
+def run_columns(path):
+    """
+    Column names of a run, from either the csv or the binary file.
+    """
+    run = open_binary(path)
+    if run is not None:
+        with run:
+            return run.columns
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def load_run(path, columns=None):
+    """
+    Loads a run as a dataframe. Uses the binary run file when there is one and
+    only reads the asked for columns (copied out, so the file is closed again).
+    Columns missing from the run are left out so callers can check for them.
+    """
+    run = open_binary(path)
+    if run is not None:
+        with run:
+            return run.to_frame(columns, copy=True)
+    if columns is None:
+        return pd.read_csv(path)
+    available = set(pd.read_csv(path, nrows=0).columns)
+    return pd.read_csv(path, usecols=[c for c in columns if c in available])
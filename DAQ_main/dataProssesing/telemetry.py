@@ -0,0 +1,147 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from projection import LocalProjection
+from runFile import load_run, open_binary, run_columns
+
+#one row of a TelemetryStore, for code that wants a single point at a time
+#x / y are meters east / north of the run's first fix
+DataPoint = namedtuple("DataPoint", ["latitude", "longitude", "speed", "acceleration", "time", "x", "y"])
+
+#store field -> text the run column name has to contain (first match wins, case insensitive)
+COLUMN_KEYS = {
+    "lat": "lat",
+    "lon": "lon",
+    "time": "millis",
+    "vx": "vx_imu",
+    "vy": "vy_imu",
+    "ax": "ax_w",
+    "ay": "ay_w",
+}
+#rows per chunk when loading a run a piece at a time
+CHUNK_ROWS = 50000
+
+def find_columns(headers):
+    """
+    Maps each COLUMN_KEYS field to the matching run column.
+    Raises ValueError if one is missing.
+    """
+    header_map = {h.strip().lower(): h for h in headers}
+    columns = {}
+    for field, key in COLUMN_KEYS.items():
+        match = next((h for k, h in header_map.items() if key in k), None)
+        if match is None:
+            raise ValueError(f"no column containing '{key}'")
+        columns[field] = match
+    return columns
+
+class TelemetryStore:
+    """
+    Struct of arrays of the points the GPS display plays back: one numpy column
+    each for lat, lon, speed, acceleration and time (ms), plus x / y, the fixes
+    projected once into meters east / north of projection's origin so nothing
+    downstream has to project again.
+    """
+    __slots__ = ("lat", "lon", "speed", "accel", "time", "x", "y", "projection", "rows_skipped")
+
+    def __init__(self, lat, lon, speed, accel, time, x=None, y=None, projection=None, rows_skipped=0):
+        self.lat = lat
+        self.lon = lon
+        self.speed = speed
+        self.accel = accel
+        self.time = time
+        if projection is None:
+            projection = LocalProjection.from_fixes(lat, lon)
+        if x is None or y is None:
+            x, y = projection.to_xy(lat, lon) if projection is not None else (np.empty(0), np.empty(0))
+        self.x = x
+        self.y = y
+        self.projection = projection
+        self.rows_skipped = rows_skipped
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0), np.empty(0), np.empty(0), np.empty(0), np.empty(0, dtype=np.int64))
+
+    @classmethod
+    def from_frame(cls, df, columns, projection=None):
+        """
+        Builds a store from a run dataframe, columns being the output of find_columns.
+        Rows with unreadable values are dropped, rows from before the GPS has a fix
+        are dropped and counted in rows_skipped. Pass the projection of an earlier
+        chunk of the same run so all chunks share one origin, by default it is the
+        first fix.
+        """
+        values = {field: pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+                  for field, name in columns.items()}
+
+        valid = np.ones(len(df), dtype=bool)
+        for column in values.values():
+            valid &= np.isfinite(column)
+        fix = valid & (values["lat"] != 0) & (values["lon"] != 0)
+
+        return cls(
+            lat=values["lat"][fix],
+            lon=values["lon"][fix],
+            speed=np.hypot(values["vx"][fix], values["vy"][fix]),
+            accel=np.hypot(values["ax"][fix], values["ay"][fix]),
+            time=values["time"][fix].astype(np.int64),
+            projection=projection,
+            rows_skipped=int(np.count_nonzero(valid & ~fix)),
+        )
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Loads only the needed columns of a run (.daq if there is one, csv otherwise).
+        """
+        columns = find_columns(run_columns(path))
+        return cls.from_frame(load_run(path, list(columns.values())), columns)
+
+    @classmethod
+    def concat(cls, stores):
+        stores = list(stores)
+        if not stores:
+            return cls.empty()
+        # chunks of one run share a projection (see from_frame), keep the first one that has fixes
+        projection = next((s.projection for s in stores if s.projection is not None), None)
+        return cls(*(np.concatenate([getattr(s, name) for s in stores]) for name in ("lat", "lon", "speed", "accel", "time", "x", "y")),
+                   projection=projection, rows_skipped=sum(s.rows_skipped for s in stores))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, i):
+        return DataPoint(float(self.lat[i]), float(self.lon[i]), float(self.speed[i]), float(self.accel[i]), int(self.time[i]),
+                         float(self.x[i]), float(self.y[i]))
+
+def iter_file_chunks(path, chunk_rows=CHUNK_ROWS):
+    """
+    Loads a run chunk_rows rows at a time, yielding (TelemetryStore of the chunk,
+    fraction of the file loaded so far). Raises ValueError if columns are missing.
+    """
+    columns = find_columns(run_columns(path))
+    names = list(columns.values())
+    projection = None
+
+    run = open_binary(path)
+    if run is not None:
+        # memory mapped, slicing it up only costs the store building. The stores are
+        # copies, so no view into the map is left once the file is read (or the load cancelled)
+        with run:
+            for start in range(0, len(run), chunk_rows):
+                end = min(start + chunk_rows, len(run))
+                store = TelemetryStore.from_frame(run.to_frame(names).iloc[start:end], columns, projection)
+                projection = store.projection
+                yield store, end / len(run)
+        return
+
+    size = max(os.path.getsize(path), 1)
+    with open(path, "rb") as f:
+        for df in pd.read_csv(f, usecols=names, chunksize=chunk_rows):
+            store = TelemetryStore.from_frame(df, columns, projection)
+            projection = store.projection
+            yield store, min(f.tell() / size, 1.0)